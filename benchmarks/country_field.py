@@ -0,0 +1,82 @@
+"""
+Benchmark loading rows with a CountryField: the old SubfieldBase field against the current
+field, with and without compact=True.
+
+Usage: python benchmarks/country_field.py [rows]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings
+
+settings.configure(
+    DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+    INSTALLED_APPS=['iris_lib'],
+)
+
+import django
+django.setup()
+
+from django.db import connection, models
+from iris_lib.country import CountryField, COUNTRIES
+
+
+class SubfieldCountryField(CountryField):
+    """
+    The field as it was, converting on every attribute assignment
+    """
+    __metaclass__ = models.SubfieldBase
+
+
+class SubfieldStation(models.Model):
+    name = models.CharField(max_length=50)
+    country = SubfieldCountryField()
+
+    class Meta:
+        app_label = 'iris_lib'
+
+
+class Station(models.Model):
+    name = models.CharField(max_length=50)
+    country = CountryField()
+
+    class Meta:
+        app_label = 'iris_lib'
+
+
+class CompactStation(models.Model):
+    name = models.CharField(max_length=50)
+    country = CountryField(compact=True)
+
+    class Meta:
+        app_label = 'iris_lib'
+
+
+def populate(model, count):
+    with connection.schema_editor() as editor:
+        editor.create_model(model)
+    codes = [code for code, name in COUNTRIES]
+    model.objects.bulk_create(
+        [model(name="Station %d" % i, country=codes[i % len(codes)]) for i in xrange(count)],
+        batch_size=500)
+
+
+def bench(model):
+    def run():
+        # Touch the values, as a page listing them would
+        return [station.country for station in model.objects.all()]
+    return min(timeit.repeat(run, number=1, repeat=3))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for model in (SubfieldStation, Station, CompactStation):
+        populate(model, count)
+    original = bench(SubfieldStation)
+    print "SubfieldBase, %d rows: %.2fs" % (count, original)
+    for label, model in (('from_db_value', Station), ('compact', CompactStation)):
+        current = bench(model)
+        print "%s, %d rows: %.2fs (%.1fx)" % (label, count, current, original / current)
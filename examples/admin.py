@@ -1,3 +1,28 @@
 from django.contrib import admin
+from examples.models import Nation, Institution, Person
+from iris_lib.admin import (RelatedLoadingAdminMixin, LinkedObjectAdminMixin, CSVExportAdminMixin,
+                            Select2AdminMixin)
 
-# Register your models here.
+
+class NationAdmin(admin.ModelAdmin):
+    search_fields = ['name']
+
+
+class InstitutionAdmin(RelatedLoadingAdminMixin, Select2AdminMixin, admin.ModelAdmin):
+    search_fields = ['name']
+    list_display = ('__str__',)
+    # The label includes the nation name
+    label_select_related = ['nation']
+
+
+class PersonAdmin(RelatedLoadingAdminMixin, LinkedObjectAdminMixin, CSVExportAdminMixin,
+                  admin.ModelAdmin):
+    list_display = ('name', 'institution')
+    list_only_displayed = True
+    csv_export_fields = ('name', 'institution__name')
+    csv_export_headers = ('Name', 'Institution')
+
+
+admin.site.register(Nation, NationAdmin)
+admin.site.register(Institution, InstitutionAdmin)
+admin.site.register(Person, PersonAdmin)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('email', models.EmailField(max_length=254, verbose_name='Email Address')),
+                ('submitted_date', models.DateTimeField(auto_now_add=True, verbose_name='Submitted Date')),
+                ('ip_address', models.CharField(help_text=b'IP address of the submitter', verbose_name='IP Address', max_length=64, editable=False, blank=True)),
+                ('spam_score', models.IntegerField(help_text=b'0=definitely not spam, 100=definitely spam.', verbose_name='Spam Score', null=True, editable=False, blank=True)),
+                ('name', models.CharField(max_length=100)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
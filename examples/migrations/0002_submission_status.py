@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import iris_lib.field_choices
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examples', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='status',
+            field=iris_lib.field_choices.CompactChoicesField(default=1, choices=[(1, 'New'), (2, 'Pending Review'), (3, 'Accepted')]),
+        ),
+    ]
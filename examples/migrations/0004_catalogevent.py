@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examples', '0003_nation_institution_person'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEvent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('event_id', models.IntegerField(unique=True)),
+                ('time', models.DateTimeField(null=True)),
+                ('latitude', models.DecimalField(null=True, max_digits=8, decimal_places=4)),
+                ('longitude', models.DecimalField(null=True, max_digits=8, decimal_places=4)),
+                ('magnitude', models.DecimalField(null=True, max_digits=4, decimal_places=2)),
+                ('location', models.CharField(max_length=200, blank=True)),
+            ],
+        ),
+    ]
@@ -1,3 +1,54 @@
 from django.db import models
+from iris_lib.field_choices import Choices, Choice, CompactChoicesField
+from iris_lib.form_mixins import FormModelMixin
 
-# Create your models here.
+
+class SubmissionStatus(Choices):
+    NEW = Choice("New", code=1)
+    PENDING_REVIEW = Choice("Pending Review", code=2)
+    ACCEPTED = Choice("Accepted", code=3)
+
+
+class Submission(FormModelMixin):
+    """
+    A public form submission, see SpamCheckMixin
+    """
+    name = models.CharField(max_length=100)
+    status = CompactChoicesField(SubmissionStatus, default=SubmissionStatus.NEW)
+
+
+class Nation(models.Model):
+    name = models.CharField(max_length=100)
+
+    def __unicode__(self):
+        return self.name
+
+
+class Institution(models.Model):
+    name = models.CharField(max_length=100)
+    nation = models.ForeignKey(Nation)
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.name, self.nation.name)
+
+
+class Person(models.Model):
+    name = models.CharField(max_length=100)
+    institution = models.ForeignKey(Institution, related_name='people')
+    previous_institution = models.ForeignKey(Institution, related_name='former_people',
+                                             null=True, blank=True)
+
+    def __unicode__(self):
+        return self.name
+
+
+class CatalogEvent(models.Model):
+    """
+    An event copied from the web service, see ws_client.sync
+    """
+    event_id = models.IntegerField(unique=True)
+    time = models.DateTimeField(null=True)
+    latitude = models.DecimalField(max_digits=8, decimal_places=4, null=True)
+    longitude = models.DecimalField(max_digits=8, decimal_places=4, null=True)
+    magnitude = models.DecimalField(max_digits=4, decimal_places=2, null=True)
+    location = models.CharField(max_length=200, blank=True)
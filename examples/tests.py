@@ -1,3 +1,405 @@
 from django.test import TestCase
+from django.test.client import RequestFactory
+from examples.webservices import WebserviceView
+from iris_lib.ws_client.events import Event
+from decimal import Decimal
+import mock
 
-# Create your tests here.
+
+class WebserviceViewTest(TestCase):
+    """
+    Test the streaming WebserviceView
+    """
+
+    def test_streaming(self):
+        events = [
+            Event({'EventID': '1', 'EventLocationName': 'NEAR COAST OF PERU', 'MagType': 'mb', 'Magnitude': '5.1'}),
+            Event({'EventID': '2', 'EventLocationName': 'FIJI ISLANDS', 'MagType': 'Mw', 'Magnitude': '6.0'}),
+        ]
+        request = RequestFactory().get('/ws/')
+        with mock.patch.object(WebserviceView, 'get_ws_data', return_value=iter(events)):
+            response = WebserviceView.as_view()(request)
+            self.assertTrue(response.streaming)
+            chunks = list(response.streaming_content)
+        # The page head is sent before any rows
+        self.assertIn('<tbody>', chunks[0])
+        self.assertNotIn('Peru', chunks[0])
+        content = ''.join(chunks)
+        self.assertIn('Near Coast Of Peru', content)
+        self.assertIn('Mw 6.0', content)
+        self.assertTrue(content.index('Fiji Islands') < content.index('</tbody>'))
+
+    def test_missing_rows(self):
+        from django.core.exceptions import ImproperlyConfigured
+        request = RequestFactory().get('/ws/')
+        with mock.patch.object(WebserviceView, 'template_name', 'examples/webservice_row.html'):
+            with self.assertRaisesRegexp(ImproperlyConfigured, 'examples/webservice_row.html'):
+                WebserviceView.as_view()(request)
+
+
+class SpamCheckViewTest(TestCase):
+    """
+    Test that SpamCheckMixin stores the score of a submission made through a CreateView
+    """
+
+    def test_blocklisted(self):
+        from django.views.generic.edit import CreateView
+        from examples.models import Submission
+        from iris_lib import spam
+        from iris_lib.background import synchronous
+        from iris_lib.form_mixins import SpamCheckMixin
+
+        class SubmissionView(SpamCheckMixin, CreateView):
+            model = Submission
+            fields = ['name', 'email']
+            success_url = '/done/'
+
+        scorer = spam.SpamScorer(spam.StubSpamService({'ok@example.com': 10}),
+                                 blocklist=['192.0.2.1'])
+        view = SubmissionView.as_view()
+        factory = RequestFactory()
+        with mock.patch.object(spam, '_scorer', scorer), synchronous():
+            for name, ip_address in (('spammer', '192.0.2.1'), ('person', '198.51.100.1')):
+                response = view(factory.post('/', {'name': name, 'email': 'ok@example.com'},
+                                             REMOTE_ADDR=ip_address))
+                self.assertEqual(response.status_code, 302)
+        spammer = Submission.objects.get(name='spammer')
+        self.assertEqual((spammer.ip_address, spammer.spam_score), ('192.0.2.1', 100))
+        self.assertEqual(Submission.objects.get(name='person').spam_score, 10)
+
+
+class CompactChoicesFieldValidationTest(TestCase):
+    """
+    Test that the integer range checks of a CompactChoicesField apply to the stored code
+    """
+
+    def test_full_clean(self):
+        from django.core.exceptions import ValidationError
+        from django.db import connection
+        from examples.models import Submission, SubmissionStatus
+        from iris_lib.field_choices import Choices, Choice, CompactChoicesField
+
+        class WideStatus(Choices):
+            SMALL = Choice(code=1)
+            HUGE = Choice(code=40000)
+
+        status_field = Submission._meta.get_field('status')
+        wide_field = CompactChoicesField(WideStatus)
+        # The range validators are cached on the field, so clear them around the patch
+        status_field.__dict__.pop('validators', None)
+        try:
+            with mock.patch.object(connection.ops, 'integer_field_range',
+                                   return_value=(-32768, 32767)):
+                submission = Submission(name='Someone', email='someone@example.com',
+                                        status=SubmissionStatus.PENDING_REVIEW)
+                submission.full_clean()
+                self.assertEqual(wide_field.clean(WideStatus.SMALL, None), 'SMALL')
+                self.assertRaises(ValidationError, wide_field.clean, WideStatus.HUGE, None)
+        finally:
+            status_field.__dict__.pop('validators', None)
+
+
+class ExampleAdminTestCase(TestCase):
+    """
+    Base for tests of the example admin pages
+    """
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from examples.models import Nation, Institution, Person
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        self.nation = Nation.objects.create(name='Peru')
+        self.institution = Institution.objects.create(name='IGP', nation=self.nation)
+
+    def add_people(self, count):
+        from examples.models import Nation, Institution, Person
+        for i in range(count):
+            nation = Nation.objects.create(name='Nation %d' % i)
+            institution = Institution.objects.create(name='Institution %d' % i, nation=nation)
+            Person.objects.create(name='Person %d' % i, institution=institution)
+
+    def count_queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        # Warm up any caches (eg. of content types) first
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+
+class RelatedLoadingAdminTest(ExampleAdminTestCase):
+    """
+    Test that RelatedLoadingAdminMixin pages take the same number of queries however many rows
+    """
+
+    def test_changelist(self):
+        self.add_people(2)
+        few, response = self.count_queries('/admin/examples/person/')
+        self.assertContains(response, 'Institution 1 (Nation 1)')
+        self.add_people(5)
+        many, response = self.count_queries('/admin/examples/person/')
+        self.assertEqual(few, many)
+
+    def test_list_only(self):
+        from django.contrib import admin
+        from examples.models import Person
+        person_admin = admin.site._registry[Person]
+        list_display = person_admin.list_display
+        select_related = person_admin.get_list_select_related(list_display)
+        self.assertEqual(select_related, ['institution__nation'])
+        # Only the first hop is named, so the institution isn't deferred
+        self.assertEqual(sorted(person_admin.get_list_only(list_display, select_related)),
+                         ['institution', 'name', 'pk'])
+
+    def test_debug_query_count(self):
+        from django.contrib import admin
+        from django.test.client import RequestFactory
+        from django.test.utils import override_settings
+        from django.contrib.auth.models import User
+        from examples.models import Person
+        self.add_people(2)
+        with override_settings(DEBUG=True):
+            count, response = self.count_queries('/admin/examples/person/')
+            # This counts only the view and the rendering, not (eg.) the session lookup
+            self.assertTrue(0 < int(response['X-Query-Count']) < count)
+            # The response is left for the handler to render
+            request = RequestFactory().get('/admin/examples/person/')
+            request.user = User.objects.get(username='admin')
+            response = admin.site._registry[Person].changelist_view(request)
+            self.assertFalse(response.is_rendered)
+            self.assertNotIn('X-Query-Count', response)
+            response.render()
+            self.assertIn('X-Query-Count', response)
+
+    def test_change_form(self):
+        from examples.models import Person
+        person = Person.objects.create(name='Someone', institution=self.institution)
+        url = '/admin/examples/person/%d/' % person.pk
+        few, response = self.count_queries(url)
+        self.assertContains(response, 'IGP (Peru)')
+        self.add_people(5)
+        many, response = self.count_queries(url)
+        self.assertContains(response, 'Institution 4 (Nation 4)')
+        self.assertEqual(few, many)
+
+
+class Select2AdminTest(ExampleAdminTestCase):
+    """
+    Test the remote Select2 lookups in the admin
+    """
+
+    def get_request(self):
+        from django.contrib.auth.models import User
+        from django.test.client import RequestFactory
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(username='admin')
+        return request
+
+    def test_inline(self):
+        from django.contrib import admin
+        from examples.models import Institution, Person
+        from iris_lib.admin import Select2AdminMixin
+        from iris_lib.select2widget import Select2
+
+        class PersonInline(Select2AdminMixin, admin.TabularInline):
+            model = Person
+            fk_name = 'institution'
+            select2_remote_threshold = 0
+
+        inline = PersonInline(Institution, admin.site)
+        # An inline has no lookup view, so it lists the rows
+        field = inline.formfield_for_dbfield(Person._meta.get_field('previous_institution'),
+                                             request=self.get_request())
+        self.assertIsInstance(field.widget.widget, Select2)
+
+    def test_limit_choices_to(self):
+        import json
+        import mock
+        from django.contrib import admin
+        from examples.models import Nation, Institution
+        Nation.objects.create(name='Chile')
+        institution_admin = admin.site._registry[Institution]
+        db_field = Institution._meta.get_field('nation')
+        with mock.patch.object(institution_admin, 'select2_remote_threshold', 0), \
+                mock.patch.object(db_field.rel, 'limit_choices_to', {'name__startswith': 'P'}):
+            widget = institution_admin.formfield_for_dbfield(
+                db_field, request=self.get_request()).widget.widget
+            self.assertEqual(widget.url, '/admin/examples/institution/select2/nation/')
+            self.assertEqual(list(widget.queryset), [self.nation])
+            data = json.loads(self.client.get(widget.url).content)
+        self.assertEqual([r['text'] for r in data['results']], ['Peru'])
+
+
+class LinkedObjectAdminTest(ExampleAdminTestCase):
+    """
+    Test the "Currently:" links on a change form with two foreign keys to the same model
+    """
+
+    def test_labels(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from examples.models import Nation, Institution, Person
+        previous = Institution.objects.create(
+            name='UCh', nation=Nation.objects.create(name='Chile'))
+        person = Person.objects.create(name='Someone', institution=self.institution,
+                                       previous_institution=previous)
+        url = '/admin/examples/person/%d/' % person.pk
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, '<a href="/admin/examples/institution/%d/">IGP (Peru)</a>' %
+                            self.institution.pk)
+        self.assertContains(response, '<a href="/admin/examples/institution/%d/">UCh (Chile)</a>' %
+                            previous.pk)
+        # Both labels come from one query
+        lookups = [q for q in queries if '"examples_institution"."id" IN' in q['sql']]
+        self.assertEqual(len(lookups), 1)
+
+        # A bad value is shown as it is
+        response = self.client.post(url, {'name': 'Someone', 'institution': self.institution.pk,
+                                          'previous_institution': 'bad'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'IGP (Peru)</a>')
+        self.assertContains(response, '>bad</a>')
+
+
+class QuerysetCSVTest(ExampleAdminTestCase):
+    """
+    Test streaming a queryset as CSV
+    """
+
+    def test_pages(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from examples.models import Person
+        from iris_lib.csv_utils import iter_queryset_values
+        self.add_people(4)
+        queryset = Person.objects.all()
+        expected = [('Person %d' % i, 'Institution %d' % i) for i in range(4)]
+        for chunk_size, query_count in ((3, 2), (4, 2), (5, 1)):
+            with CaptureQueriesContext(connection) as queries:
+                rows = list(iter_queryset_values(queryset, ['name', 'institution__name'],
+                                                 chunk_size=chunk_size))
+            self.assertEqual(rows, expected)
+            # A full last page takes one more (empty) query to find the end
+            self.assertEqual(len(queries), query_count)
+        self.assertEqual(list(iter_queryset_values(queryset.none(), ['name'])), [])
+        # The queryset's order is kept
+        for ordering in (['-pk'], ['-name'], ['institution__name', '-pk']):
+            expected = list(queryset.order_by(*ordering).values_list('name'))
+            rows = list(iter_queryset_values(queryset.order_by(*ordering), ['name'], chunk_size=3))
+            self.assertEqual(rows, expected)
+        self.assertEqual(rows[0], ('Person 0',))
+        self.assertEqual(list(iter_queryset_values(queryset.order_by('-name'), ['name'],
+                                                   chunk_size=3))[0], ('Person 3',))
+        self.assertEqual(list(iter_queryset_values(queryset.filter(name='Nobody'), ['name'])), [])
+
+    def test_response(self):
+        from examples.models import Person
+        from iris_lib.csv_utils import queryset_csv_response
+        response = queryset_csv_response(Person.objects.all(), ['name', 'institution__name'],
+                                         header=['Name', 'Institution'])
+        self.assertEqual(''.join(response.streaming_content), 'Name,Institution\r\n')
+        self.add_people(2)
+        response = queryset_csv_response(Person.objects.all(), ['name', 'institution__name'],
+                                         header=['Name', 'Institution'], filename='people.csv',
+                                         chunk_size=2)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="people.csv"')
+        self.assertEqual(''.join(response.streaming_content),
+                         'Name,Institution\r\nPerson 0,Institution 0\r\nPerson 1,Institution 1\r\n')
+
+
+class CSVExportAdminTest(ExampleAdminTestCase):
+    """
+    Test the CSV export admin action
+    """
+
+    def test_export(self):
+        from examples.models import Person
+        self.add_people(3)
+        people = Person.objects.order_by('pk')
+        response = self.client.post('/admin/examples/person/', {
+            'action': 'export_csv',
+            '_selected_action': [people[0].pk, people[2].pk],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="person.csv"')
+        # In the changelist's order, newest first
+        self.assertEqual(''.join(response.streaming_content),
+                         'Name,Institution\r\nPerson 2,Institution 2\r\nPerson 0,Institution 0\r\n')
+
+    def test_popup(self):
+        from django.contrib import admin
+        from django.test.client import RequestFactory
+        from django.contrib.auth.models import User
+        from examples.models import Person
+        person_admin = admin.site._registry[Person]
+        for path, expected in (('/', True), ('/?_popup=1', False)):
+            request = RequestFactory().get(path)
+            request.user = User.objects.get(username='admin')
+            self.assertEqual('export_csv' in person_admin.get_actions(request), expected)
+
+
+class EntitySyncTest(TestCase):
+    """
+    Test writing events to a model in batches
+    """
+
+    def make_event(self, event_id, magnitude='5.1', location='FIJI ISLANDS'):
+        return Event({'EventID': str(event_id), 'Time': '2014-01-02T03:04:05',
+                      'Latitude': '-17.5', 'Longitude': '178.25', 'Magnitude': magnitude,
+                      'EventLocationName': location})
+
+    def test_counters(self):
+        from examples.models import CatalogEvent
+        from iris_lib.ws_client.sync import sync_events
+        sync = sync_events(CatalogEvent, [self.make_event(i) for i in range(5)], batch_size=2)
+        self.assertEqual((sync.processed, sync.created, sync.updated, sync.skipped, sync.batches),
+                         (5, 5, 0, 0, 3))
+        events = [self.make_event(i) for i in range(5)]
+        events[1] = self.make_event(1, magnitude='6.0')
+        events[3] = self.make_event(3, location='PERU')
+        events.append(Event({'EventLocationName': 'NO ID'}))
+        events.append(self.make_event(5))
+        sync = sync_events(CatalogEvent, events)
+        # 2 changed, 3 unchanged and 1 without an id are skipped, 1 new
+        self.assertEqual((sync.created, sync.updated, sync.skipped), (1, 2, 4))
+        self.assertEqual(CatalogEvent.objects.get(event_id=1).magnitude, Decimal('6.00'))
+        self.assertEqual(CatalogEvent.objects.get(event_id=3).location, 'Peru')
+        self.assertEqual(CatalogEvent.objects.get(event_id=4).location, 'Fiji Islands')
+        sync = sync_events(CatalogEvent, [self.make_event(0, magnitude='7.0')],
+                           update_existing=False)
+        self.assertEqual((sync.updated, sync.skipped), (0, 1))
+        self.assertEqual(CatalogEvent.objects.get(event_id=0).magnitude, Decimal('5.10'))
+
+    def test_duplicates(self):
+        from examples.models import CatalogEvent
+        from iris_lib.ws_client.sync import sync_events
+        events = [self.make_event(1), self.make_event(1, magnitude='6.5'), self.make_event(2)]
+        sync = sync_events(CatalogEvent, events)
+        self.assertEqual((sync.processed, sync.created), (3, 2))
+        # The last one wins
+        self.assertEqual(CatalogEvent.objects.get(event_id=1).magnitude, Decimal('6.50'))
+
+    def test_query_count(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from examples.models import CatalogEvent
+        from iris_lib.ws_client.sync import EntitySync
+        sync = EntitySync(CatalogEvent, batch_size=200)
+        sync.sync(self.make_event(i) for i in range(200))
+        events = [self.make_event(i, magnitude='6.0' if i % 2 else '5.1') for i in range(200)]
+        with CaptureQueriesContext(connection) as queries:
+            sync.reset()
+            sync.sync(events)
+        self.assertEqual((sync.updated, sync.skipped), (100, 100))
+        statements = [q['sql'] for q in queries if 'SAVEPOINT' not in q['sql']]
+        # One select; SQLite limits the parameters, so the updates are split into a few queries
+        self.assertIn('SELECT', statements[0])
+        self.assertTrue(all('UPDATE' in s for s in statements[1:]))
+        self.assertLessEqual(len(statements), 1 + 100 // (999 // (2 * len(sync.fields) + 1)) + 1)
+        self.assertEqual(CatalogEvent.objects.filter(magnitude=Decimal('6.0')).count(), 100)
@@ -1,8 +1,10 @@
 from django.conf.urls import patterns, include, url
 from examples.coordinates import CoordinatesView
 from examples.webservices import WebserviceView
+from iris_lib.views import CountryLookupView
 
 urlpatterns = patterns('',
     url(r'coordinates/', CoordinatesView.as_view()),
     url(r'ws/', WebserviceView.as_view()),
+    url(r'countries/', CountryLookupView.as_view(), name='country_lookup'),
 )
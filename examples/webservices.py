@@ -1,15 +1,16 @@
 from django.utils.translation import ugettext_lazy as _
 from django.views.generic.base import TemplateView
+from iris_lib.streaming import StreamingTemplateMixin
 from iris_lib.ws_client.events import EventRequest
 import datetime
 
-class WebserviceView(TemplateView):
+class WebserviceView(StreamingTemplateMixin, TemplateView):
     template_name = 'examples/webservices.html'
+    row_template_name = 'examples/webservice_row.html'
+    row_context_name = 'event'
 
-    def get_context_data(self, **kwargs):
-        context = super(WebserviceView, self).get_context_data(**kwargs)
-        context['events'] = self.get_ws_data()
-        return context
+    def get_rows(self):
+        return self.get_ws_data()
     
     def get_ws_data(self):
         req = EventRequest(
@@ -17,4 +18,4 @@ class WebserviceView(TemplateView):
             endtime=datetime.datetime(2015, 1, 5),
         )
         return req.get()
-    
\ No newline at end of file
+    
@@ -1,29 +1,137 @@
-from django.utils.translation import ugettext_lazy as _
-from django.forms.widgets import Widget
-import copy
-from django.core.urlresolvers import reverse
-from django.utils.safestring import mark_safe
+from django.conf import settings
+from django.conf.urls import url
+from django.contrib.admin.options import IS_POPUP_VAR
 from django.contrib.admin.widgets import RelatedFieldWidgetWrapper
-from iris_lib.select2widget import Select2, Select2Multiple
-from django.utils.encoding import force_text
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import PermissionDenied
+from django.core.urlresolvers import get_script_prefix, get_urlconf, reverse
+from django.db import connection
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.fields.related import ForeignObjectRel
+from django.forms.widgets import Widget
+from django.http.response import Http404
+from django.utils.encoding import force_text
+from django.utils.http import RFC3986_SUBDELIMS, urlquote
+from django.utils.log import getLogger
+from django.utils.safestring import mark_safe
+from django.utils.text import capfirst
+from django.utils.translation import get_language, ugettext_lazy as _
+from iris_lib.csv_utils import queryset_csv_response
+from iris_lib.select2widget import (Select2, Select2Multiple, Select2Remote, Select2RemoteMultiple,
+                                    SELECT2_REMOTE_THRESHOLD)
+from iris_lib.views import ModelSelect2LookupView
+import copy
+import time
+
+LOGGER = getLogger(__name__)
+
+
+#####
+# Admin URLs
+#
+# Reversing a URL is fairly slow, which adds up when (eg.) every row in a list links to an object.
+# These resolve the URL pattern for each model and admin view once, then fill in the primary key.
+#####
+
+# Stands in for the primary key when resolving a URL pattern
+PK_PLACEHOLDER = '__pk__'
+
+# Admin views that take the object's primary key
+ADMIN_OBJECT_VIEWS = ('change', 'delete', 'history')
+
+_admin_url_patterns = {}
+
+
+def clear_admin_url_cache():
+    _admin_url_patterns.clear()
 
 
-def get_change_url(instance):
+def get_admin_url_pattern(model, view, current_app=None):
+    """
+    Return the URL for the given admin view of a model (or instance); for views taking a primary
+    key, this is a (prefix, suffix) tuple that goes around the quoted key.
+    """
+    opts = model._meta
+    # The pattern may vary by language, with i18n_patterns()
+    key = (opts.app_label, opts.model_name, view, current_app,
+           get_urlconf() or settings.ROOT_URLCONF, get_script_prefix(), get_language())
+    try:
+        return _admin_url_patterns[key]
+    except KeyError:
+        name = 'admin:%s_%s_%s' % (opts.app_label, opts.model_name, view)
+        if view in ADMIN_OBJECT_VIEWS:
+            pattern = tuple(reverse(name, args=(PK_PLACEHOLDER,), current_app=current_app).split(
+                PK_PLACEHOLDER, 1))
+        else:
+            pattern = reverse(name, current_app=current_app)
+        _admin_url_patterns[key] = pattern
+        return pattern
+
+
+def get_admin_url(model, view, pk=None, current_app=None):
+    """
+    Get the URL for an admin view of a model (or instance).  This is equivalent to reverse(),
+    but only resolves the URL the first time.
+    """
+    pattern = get_admin_url_pattern(model, view, current_app=current_app)
+    if view in ADMIN_OBJECT_VIEWS:
+        # Quoted the same way as reverse() does it
+        return urlquote(force_text(pk), safe=RFC3986_SUBDELIMS + str('/~:@')).join(pattern)
+    return pattern
+
+
+def get_change_url(instance, current_app=None):
     """
     Get the URL for the change_view for the given instance
     """
-    return reverse('admin:%s_%s_change' % (
-        instance._meta.app_label,
-        instance._meta.model_name),
-        args=(instance.pk,))
+    return get_admin_url(instance, 'change', instance.pk, current_app=current_app)
+
+
+def get_add_url(model, current_app=None):
+    return get_admin_url(model, 'add', current_app=current_app)
+
+
+class LinkedObjectLabels(object):
+    """
+    Looks up the labels for the current values of all the LinkedObjectWidgetWrappers in a form, the
+    first time any of them is needed.  This makes one query per related model.
+    """
 
+    def __init__(self, form):
+        self.form = form
+        self.labels = None
 
-def get_add_url(model):
-    return reverse('admin:%s_%s_add' % (
-        model._meta.app_label,
-        model._meta.model_name,
-    ))
+    def get_label(self, widget, value):
+        if self.labels is None:
+            self.labels = self.load_labels()
+        return self.labels.get((widget, force_text(value)))
+
+    def load_labels(self):
+        labels = {}
+        # Collect the values for each related model
+        values_by_model = {}
+        querysets = {}
+        for name, field in self.form.fields.items():
+            widget = field.widget
+            if isinstance(widget, LinkedObjectWidgetWrapper):
+                value = self.form[name].value()
+                if value:
+                    values_by_model.setdefault(widget.rel_to, []).append((widget, value))
+                    # The field's queryset may select_related what the labels need
+                    if getattr(field, 'queryset', None) is not None:
+                        querysets.setdefault(widget.rel_to, field.queryset)
+        for model, widget_values in values_by_model.items():
+            queryset = querysets.get(model, model._default_manager)
+            try:
+                objects = queryset.in_bulk(set(v for w, v in widget_values))
+            except (ValueError, TypeError):
+                # Invalid value (eg. from a bad submission), leave it to the widget
+                continue
+            for widget, value in widget_values:
+                obj = objects.get(value) or objects.get(model._meta.pk.to_python(value))
+                if obj is not None:
+                    labels[(widget, force_text(value))] = widget.label_from_instance(obj)
+        return labels
 
 
 class LinkedObjectWidgetWrapper(Widget):
@@ -31,16 +139,21 @@ class LinkedObjectWidgetWrapper(Widget):
     This works like the RelatedFieldWidgetWrapper, which adds the (+) link for admin dropdowns.
     This version prepends a link to the change page for the current value.
     """
-    def __init__(self, widget, rel_to, admin_site, *args, **kwargs):
+    def __init__(self, widget, rel_to, admin_site, label_from_instance=None, *args, **kwargs):
         super(LinkedObjectWidgetWrapper, self).__init__(*args, **kwargs)
         self.widget = widget
         self.rel_to = rel_to
         self.admin_site = admin_site
+        if label_from_instance:
+            self.label_from_instance = label_from_instance
+        # Shared by all the wrapped widgets in a form, see LinkedObjectFormMixin
+        self.labels = None
 
     def __deepcopy__(self, memo):
         obj = copy.copy(self)
         obj.widget = copy.deepcopy(self.widget, memo)
         obj.attrs = self.widget.attrs
+        obj.labels = None
         memo[id(self)] = obj
         return obj
 
@@ -59,18 +172,29 @@ class LinkedObjectWidgetWrapper(Widget):
     def id_for_label(self, id_):
         return self.widget.id_for_label(id_)
 
+    def label_from_instance(self, obj):
+        return force_text(obj)
+
+    def get_value_label(self, value):
+        """
+        Return the label for the current value, looking it up by primary key
+        """
+        if self.labels is not None:
+            label = self.labels.get_label(self, value)
+            if label is not None:
+                return label
+        try:
+            return self.label_from_instance(self.rel_to._default_manager.get(pk=value))
+        except (self.rel_to.DoesNotExist, ValueError, TypeError):
+            return value
+
     def render(self, name, value, *args, **kwargs):
         html = self.widget.render(name, value, *args, **kwargs)
         if not value:
             return html
 
-        info = (self.rel_to._meta.app_label, self.rel_to._meta.model_name)
-        related_url = reverse('admin:%s_%s_change' % info, args=(value,), current_app=self.admin_site.name)
-        value_label = value
-        for option_value, option_label in self.widget.choices:
-            if str(option_value) == str(value):
-                value_label = option_label
-                break
+        related_url = get_admin_url(self.rel_to, 'change', value, current_app=self.admin_site.name)
+        value_label = self.get_value_label(value)
         output = u'%s <a href="%s">%s</a><br/>%s' % (
             _('Currently:'), related_url, value_label,
             html
@@ -78,6 +202,19 @@ class LinkedObjectWidgetWrapper(Widget):
         return mark_safe(output)
 
 
+class LinkedObjectFormMixin(object):
+    """
+    Form mixin that lets the LinkedObjectWidgetWrappers in the form look up their labels together
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(LinkedObjectFormMixin, self).__init__(*args, **kwargs)
+        labels = LinkedObjectLabels(self)
+        for field in self.fields.values():
+            if isinstance(field.widget, LinkedObjectWidgetWrapper):
+                field.widget.labels = labels
+
+
 class LinkedObjectAdminMixin(object):
     """
     Mixin for ModelAdmin to apply LinkedObjectWidgetWrapper
@@ -90,15 +227,51 @@ class LinkedObjectAdminMixin(object):
         formfield = super(LinkedObjectAdminMixin, self).formfield_for_dbfield(db_field, **kwargs)
         if formfield and isinstance(formfield.widget, RelatedFieldWidgetWrapper):
             formfield.widget = LinkedObjectWidgetWrapper(
-                formfield.widget, db_field.rel.to, self.admin_site)
+                formfield.widget, db_field.rel.to, self.admin_site,
+                label_from_instance=getattr(formfield, 'label_from_instance', None))
         return formfield
 
+    def get_form(self, request, obj=None, **kwargs):
+        """
+        Add LinkedObjectFormMixin to the form
+        """
+        form = kwargs.get('form', self.form)
+        if not issubclass(form, LinkedObjectFormMixin):
+            kwargs['form'] = type(form.__name__, (LinkedObjectFormMixin, form), {})
+        return super(LinkedObjectAdminMixin, self).get_form(request, obj, **kwargs)
+
+
+# Seconds to remember the row count of a table
+ROW_COUNT_TIMEOUT = 300
+_row_counts = {}
+
+
+def get_row_count(model):
+    """
+    Return the (approximate) number of rows in a model's table.  This is cached for a while, since
+    it's only used to choose between widgets.
+    """
+    now = time.time()
+    count, expires = _row_counts.get(model, (None, 0))
+    if expires < now:
+        count = model._default_manager.count()
+        _row_counts[model] = (count, now + ROW_COUNT_TIMEOUT)
+    return count
+
 
 class Select2AdminMixin(object):
     """
     Mixin for ModelAdmin that defaults to Select2Widget for all select fields
+
+    Relations to tables with more than `select2_remote_threshold` rows use a remote data source
+    (see Select2Remote) so the change form doesn't render every row as an option.  The lookup
+    searches `select2_search_fields[field_name]` if given, otherwise the `search_fields` of the
+    related model's admin.  The lookup is a URL of the ModelAdmin, so an InlineModelAdmin always
+    lists the rows.
     """
     select2_fields = None
+    select2_remote_threshold = SELECT2_REMOTE_THRESHOLD
+    select2_search_fields = None
 
     def formfield_for_dbfield(self, db_field, **kwargs):
         """
@@ -110,12 +283,302 @@ class Select2AdminMixin(object):
         else:
             use_select2 = (db_field.rel or db_field.choices)
         if use_select2:
-            if db_field.many_to_many:
+            if self.use_select2_remote(db_field):
+                kwargs.setdefault('widget', self.get_select2_remote_widget(db_field))
+            elif db_field.many_to_many:
                 kwargs.setdefault('widget', Select2Multiple)
             else:
                 kwargs.setdefault('widget', Select2)
         return super(Select2AdminMixin, self).formfield_for_dbfield(db_field, **kwargs)
 
+    def use_select2_remote(self, db_field):
+        """
+        Whether to use a remote data source for the given field
+        """
+        if not db_field.rel or self.select2_remote_threshold is None:
+            return False
+        # Only a ModelAdmin (not an inline) has URLs for the lookup view
+        if not hasattr(super(Select2AdminMixin, self), 'get_urls'):
+            return False
+        return get_row_count(db_field.rel.to) > self.select2_remote_threshold
+
+    def get_select2_queryset(self, db_field):
+        """
+        Return the related objects that can be picked for a field, for both the widget and the lookup
+        """
+        return db_field.rel.to._default_manager.complex_filter(db_field.get_limit_choices_to())
+
+    def get_select2_remote_widget(self, db_field):
+        url = reverse('admin:%s_%s_select2' % (self.opts.app_label, self.opts.model_name),
+                      args=(db_field.name,), current_app=self.admin_site.name)
+        widget_class = Select2RemoteMultiple if db_field.many_to_many else Select2Remote
+        return widget_class(url, queryset=self.get_select2_queryset(db_field))
+
+    def get_urls(self):
+        info = (self.opts.app_label, self.opts.model_name)
+        return [
+            url(r'^select2/(?P<field_name>\w+)/$',
+                self.admin_site.admin_view(self.select2_lookup_view),
+                name='%s_%s_select2' % info),
+        ] + super(Select2AdminMixin, self).get_urls()
+
+    def get_select2_search_fields(self, db_field):
+        if self.select2_search_fields and db_field.name in self.select2_search_fields:
+            return self.select2_search_fields[db_field.name]
+        related_admin = self.admin_site._registry.get(db_field.rel.to)
+        if related_admin and related_admin.search_fields:
+            # Strip the admin search prefixes, the lookup view does its own matching
+            return [f.lstrip('^=@') for f in related_admin.search_fields]
+        return None
+
+    def select2_lookup_view(self, request, field_name):
+        """
+        Remote data source for the Select2Remote widget on a relation field
+        """
+        if not (self.has_add_permission(request) or self.has_change_permission(request)):
+            raise PermissionDenied
+        try:
+            db_field = self.opts.get_field(field_name)
+        except Exception:
+            raise Http404
+        if not getattr(db_field, 'rel', None) or not db_field.editable:
+            raise Http404
+        return ModelSelect2LookupView.as_view(
+            queryset=self.get_select2_queryset(db_field),
+            search_fields=self.get_select2_search_fields(db_field),
+        )(request)
+
+
+class RelatedLoadingChangeListMixin(object):
+    """
+    ChangeList mixin that lets a RelatedLoadingAdminMixin decide how related objects are loaded
+    """
+
+    def apply_select_related(self, qs):
+        return self.model_admin.apply_list_related_loading(qs, self.list_display)
+
+
+class RelatedLoadingAdminMixin(object):
+    """
+    Mixin for ModelAdmin that loads related objects up front, rather than one query at a time.
+
+    On the changelist, the relations to select_related are derived from the foreign keys in
+    `list_display`, plus `list_select_related` (if it's a list) and `list_display_related`, which
+    lists the relations used by list_display methods (eg. 'institution__country').
+    `list_prefetch_related` is applied with prefetch_related.
+
+    If `list_only_displayed` is set, the changelist only loads the columns for the fields in
+    list_display (and list_only_extra).  This is opt-in, since list_display methods may use
+    other fields, which would then be loaded one query at a time.
+
+    `label_select_related` lists the relations used by the model's own label, eg. ['country'] if
+    an institution's label includes its country name.  Other admins use this when they show the
+    model as a related object: in a changelist column, and in the choices for a linked or Select2
+    field (or ordinary select) on the change form.  If it isn't set, the choices are loaded with
+    all the related model's foreign keys.  To set the relations for form fields by hand, set
+    `formfield_select_related` to a dict mapping field names to the relations, eg.
+    {'institution': ['country']}; fields not in the dict get none.
+
+    With DEBUG on, the number of queries for each admin page is logged and sent in an
+    X-Query-Count header.
+    """
+    list_display_related = ()
+    list_prefetch_related = ()
+    list_only_displayed = False
+    list_only_extra = ()
+    formfield_select_related = None
+    label_select_related = None
+
+    def get_changelist(self, request, **kwargs):
+        changelist = super(RelatedLoadingAdminMixin, self).get_changelist(request, **kwargs)
+        if issubclass(changelist, RelatedLoadingChangeListMixin):
+            return changelist
+        return type(changelist.__name__, (RelatedLoadingChangeListMixin, changelist), {})
+
+    def get_list_fields(self, list_display):
+        """
+        Return the model fields named in list_display
+        """
+        fields = []
+        for name in list_display:
+            if not isinstance(name, basestring):
+                continue
+            try:
+                field = self.opts.get_field(name)
+            except Exception:
+                continue
+            if not isinstance(field, ForeignObjectRel) and not field.many_to_many:
+                fields.append(field)
+        return fields
+
+    def get_list_select_related(self, list_display):
+        related = []
+        for field in self.get_list_fields(list_display):
+            if field.rel:
+                # The column shows the related object's label
+                related.append(field.name)
+                related.extend(LOOKUP_SEP.join((field.name, r))
+                               for r in self.get_label_select_related(field.rel.to, default=[]))
+        if '__str__' in list_display and self.label_select_related:
+            related.extend(self.label_select_related)
+        if isinstance(self.list_select_related, (list, tuple)):
+            related.extend(self.list_select_related)
+        related.extend(self.list_display_related)
+        # Drop any relation that a longer one already covers
+        return [r for r in set(related) if not any(o.startswith(r + '__') for o in related)]
+
+    def get_list_only(self, list_display, select_related):
+        only = set(['pk'])
+        only.update(f.name for f in self.get_list_fields(list_display))
+        only.update(self.list_only_extra)
+        # Keep the foreign key of each relation; the related objects are loaded in full.  Note
+        # that naming a longer path (eg. 'institution__nation') would defer all of the
+        # intermediate object's other fields.
+        only.update(r.split(LOOKUP_SEP)[0] for r in select_related)
+        return list(only)
+
+    def apply_list_related_loading(self, qs, list_display):
+        """
+        Apply the related object loading to the changelist queryset
+        """
+        if self.list_select_related is True:
+            qs = qs.select_related()
+        else:
+            select_related = self.get_list_select_related(list_display)
+            if select_related:
+                qs = qs.select_related(*select_related)
+            if self.list_only_displayed:
+                qs = qs.only(*self.get_list_only(list_display, select_related))
+        if self.list_prefetch_related:
+            qs = qs.prefetch_related(*self.list_prefetch_related)
+        return qs
+
+    def get_label_select_related(self, model, default=None):
+        """
+        Return the relations used by the labels of a related model, ie. the `label_select_related`
+        of its admin.  If that isn't set, return `default`, or if that's None all its foreign keys.
+        """
+        related_admin = self.admin_site._registry.get(model)
+        label_select_related = getattr(related_admin, 'label_select_related', None)
+        if label_select_related is not None:
+            return list(label_select_related)
+        if default is not None:
+            return default
+        return [f.name for f in model._meta.concrete_fields if f.rel and not f.many_to_many]
+
+    def get_formfield_select_related(self, db_field):
+        """
+        Return the relations to select_related in the choices for a relation field
+        """
+        if self.formfield_select_related is not None:
+            return self.formfield_select_related.get(db_field.name)
+        return self.get_label_select_related(db_field.rel.to)
+
+    def formfield_for_dbfield(self, db_field, **kwargs):
+        if 'queryset' not in kwargs and db_field.rel and not isinstance(db_field, ForeignObjectRel):
+            select_related = self.get_formfield_select_related(db_field)
+            if select_related:
+                queryset = self.get_field_queryset(None, db_field, kwargs.get('request'))
+                if queryset is None:
+                    queryset = db_field.rel.to._default_manager.complex_filter(
+                        db_field.get_limit_choices_to())
+                kwargs['queryset'] = queryset.select_related(*select_related)
+        return super(RelatedLoadingAdminMixin, self).formfield_for_dbfield(db_field, **kwargs)
+
+    def count_queries(self, view, request, *args, **kwargs):
+        """
+        Run a view, logging the number of queries (including rendering the response) in DEBUG mode.
+        This counts from the connection's query log, which Django keeps in DEBUG mode.
+        """
+        if not settings.DEBUG:
+            return view(request, *args, **kwargs)
+        start = time.time()
+        start_count = len(connection.queries_log)
+        response = view(request, *args, **kwargs)
+
+        def log_queries(response):
+            count = len(connection.queries_log) - start_count
+            LOGGER.debug("%s %s: %d queries in %.3fs", request.method, request.path,
+                         count, time.time() - start)
+            response['X-Query-Count'] = str(count)
+
+        # Count the queries made while rendering too, but leave the rendering to the handler
+        if getattr(response, 'is_rendered', True):
+            log_queries(response)
+        else:
+            response.add_post_render_callback(log_queries)
+        return response
+
+    def changelist_view(self, request, extra_context=None):
+        return self.count_queries(
+            super(RelatedLoadingAdminMixin, self).changelist_view, request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        return self.count_queries(
+            super(RelatedLoadingAdminMixin, self).changeform_view,
+            request, object_id, form_url, extra_context)
+
+
+class CSVExportAdminMixin(object):
+    """
+    Mixin for ModelAdmin adding an action to export the selected objects as CSV.  The export
+    is streamed, and only fetches the listed fields (following relations in the same query).
+    """
+    # Fields to export; these may span relations, eg. 'institution__name'.
+    # By default, all the concrete fields on the model.
+    csv_export_fields = None
+    # Column headers; by default, the verbose name of each field
+    csv_export_headers = None
+    # Number of rows fetched per query
+    csv_export_chunk_size = 2000
+
+    def get_actions(self, request):
+        actions = super(CSVExportAdminMixin, self).get_actions(request)
+        # Django gives no actions if they're turned off, or in a popup
+        if self.actions is not None and IS_POPUP_VAR not in request.GET:
+            action = self.get_action('export_csv')
+            actions[action[1]] = action
+        return actions
+
+    def get_csv_export_fields(self, request):
+        if self.csv_export_fields:
+            return list(self.csv_export_fields)
+        return [f.name for f in self.opts.concrete_fields]
+
+    def get_csv_export_headers(self, request, fields):
+        if self.csv_export_headers:
+            return list(self.csv_export_headers)
+        return [self.get_csv_field_label(field) for field in fields]
+
+    def get_csv_field_label(self, field_path):
+        """
+        Return the label for a (possibly related) field path
+        """
+        opts = self.opts
+        field = None
+        for name in field_path.split(LOOKUP_SEP):
+            if field is not None:
+                opts = field.rel.to._meta
+            field = opts.get_field(name)
+            if not getattr(field, 'rel', None):
+                break
+        return force_text(capfirst(getattr(field, 'verbose_name', field.name)))
+
+    def get_csv_export_filename(self, request):
+        return '%s.csv' % self.opts.model_name
+
+    def export_csv(self, request, queryset):
+        """
+        Admin action exporting the selected objects as CSV
+        """
+        fields = self.get_csv_export_fields(request)
+        return queryset_csv_response(
+            queryset, fields,
+            header=self.get_csv_export_headers(request, fields),
+            filename=self.get_csv_export_filename(request),
+            chunk_size=self.csv_export_chunk_size)
+    export_csv.short_description = _('Export selected %(verbose_name_plural)s as CSV')
+
 
 class AdminViewContextMixin(object):
     """
@@ -126,17 +589,43 @@ class AdminViewContextMixin(object):
         """
         Get the URL for the change_view for the given instance
         """
-        return reverse('admin:%s_%s_change' % (
-            instance._meta.app_label,
-            instance._meta.model_name),
-            args=(instance.pk,),
-            current_app=self.admin_site.name)
+        return get_change_url(instance, current_app=self.admin_site.name)
 
     def get_add_url(self):
-        return reverse('admin:%s_%s_add' % (
-            self.opts.app_label,
-            self.opts.model_name),
-            current_app=self.admin_site.name)
+        return get_add_url(self.model, current_app=self.admin_site.name)
+
+    def get_content_type_id(self):
+        if not hasattr(self, '_content_type_id'):
+            self._content_type_id = ContentType.objects.get_for_model(self.model).id
+        return self._content_type_id
+
+    def get_static_form_context(self, opts):
+        """
+        Return the parts of the form context that don't depend on the object.  This is cached for
+        each opts and language.
+        """
+        if not hasattr(self, '_static_form_contexts'):
+            self._static_form_contexts = {}
+        key = (opts, get_language())
+        if key not in self._static_form_contexts:
+            self._static_form_contexts[key] = {
+                'app_label': opts.app_label,
+                'module_name': force_text(opts.verbose_name_plural),
+                'opts': opts,
+                'media': self.media,
+                'is_popup': False,
+                'errors': None,
+                'preserved_filters': None,
+                'has_add_permission': True,
+                'has_change_permission': True,
+                'has_delete_permission': True,
+                'has_file_field': True,
+                'has_absolute_url': False,
+                'content_type_id': self.get_content_type_id(),
+                'save_as': self.save_as,
+                'save_on_top': self.save_on_top,
+            }
+        return self._static_form_contexts[key]
 
     def get_base_form_context(self, obj=None, title=None, opts=None):
         if not opts:
@@ -147,27 +636,13 @@ class AdminViewContextMixin(object):
                 title = _('Add %s') % force_text(opts.verbose_name)
             else:
                 title = _('Change %s') % force_text(opts.verbose_name)
-        context = {
+        context = dict(self.get_static_form_context(opts))
+        context.update({
             'add': add,
             'change': not add,
             'title': title,
-            'app_label': opts.app_label,
-            'module_name': force_text(opts.verbose_name_plural),
-            'opts': opts,
-            'media': self.media,
-            'is_popup': False,
             'inline_admin_formsets': [],
-            'errors': None,
-            'preserved_filters': None,
-            'has_add_permission': True,
-            'has_change_permission': True,
-            'has_delete_permission': True,
-            'has_file_field': True,
-            'has_absolute_url': False,
-            'content_type_id': ContentType.objects.get_for_model(self.model).id,
-            'save_as': self.save_as,
-            'save_on_top': self.save_on_top,
-        }
+        })
         if obj:
             context.update({
                 'object': obj,
@@ -0,0 +1,179 @@
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.log import getLogger
+from contextlib import contextmanager
+import os
+import Queue
+import threading
+
+LOGGER = getLogger(__name__)
+
+###
+# A small pool of background threads for work that shouldn't hold up a response, eg.
+#
+# from iris_lib.background import defer
+#
+# def form_valid(self, form):
+#     response = super(MyView, self).form_valid(form)
+#     defer(send_notification, self.object.pk)
+#     return response
+#
+# The queue is bounded, so if the workers fall behind, new work is dropped (and logged) rather
+# than piling up in memory.  Work is lost if the process exits, so this isn't a task queue;
+# use it for things that are cheap to miss or can be redone.
+#
+# Set BACKGROUND_SYNCHRONOUS = True (eg. in test settings) to run everything immediately instead,
+# or wrap a test in `with synchronous():`.
+###
+
+# Number of worker threads
+BACKGROUND_WORKERS = getattr(settings, 'BACKGROUND_WORKERS', 2)
+# Maximum number of waiting tasks
+BACKGROUND_QUEUE_SIZE = getattr(settings, 'BACKGROUND_QUEUE_SIZE', 1000)
+# Run tasks immediately, in the calling thread
+BACKGROUND_SYNCHRONOUS = getattr(settings, 'BACKGROUND_SYNCHRONOUS', False)
+
+
+def run_task(func, args, kwargs):
+    """
+    Run a task, logging (rather than raising) any error
+    """
+    try:
+        func(*args, **kwargs)
+    except Exception as e:
+        LOGGER.error("Background task %s failed: %s", getattr(func, '__name__', func), e,
+                     exc_info=1)
+
+
+class BackgroundExecutor(object):
+    """
+    Runs tasks in a fixed number of daemon threads, fed from a bounded queue
+    """
+
+    def __init__(self, workers=BACKGROUND_WORKERS, queue_size=BACKGROUND_QUEUE_SIZE,
+                 synchronous=BACKGROUND_SYNCHRONOUS):
+        self.workers = workers
+        self.synchronous = synchronous
+        self.queue = Queue.Queue(queue_size)
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        """
+        Start the worker threads, if they aren't running in this process.  This is done lazily,
+        since threads don't survive a fork (eg. by a preforking server).
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name='background-%d' % i)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+
+    def _work(self):
+        while True:
+            func, args, kwargs = self.queue.get()
+            try:
+                run_task(func, args, kwargs)
+            finally:
+                # Don't hold on to a database connection between tasks
+                close_old_connections()
+                self.queue.task_done()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) to run in the background.  Returns False if the queue was
+        full, and the task was dropped.
+        """
+        if self.synchronous:
+            run_task(func, args, kwargs)
+            return True
+        self._start()
+        try:
+            self.queue.put_nowait((func, args, kwargs))
+        except Queue.Full:
+            LOGGER.warning("Background queue is full, dropping %s",
+                           getattr(func, '__name__', func))
+            return False
+        return True
+
+    def submit_on_commit(self, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) once the current transaction commits.  In synchronous mode
+        it runs right away, since in a test the transaction may never commit.
+
+        Before Django 1.9 there's no way to wait for the commit, so if a transaction is open
+        (eg. with ATOMIC_REQUESTS) this runs the task right away in the calling thread, where it
+        can see the uncommitted data, rather than in a worker, where it couldn't.
+        """
+        if self.synchronous:
+            run_task(func, args, kwargs)
+        elif in_uncommittable_transaction():
+            LOGGER.warning("Running %s in the calling thread, since the transaction hasn't "
+                           "committed", getattr(func, '__name__', func))
+            run_task(func, args, kwargs)
+        else:
+            on_commit(lambda: self.submit(func, *args, **kwargs))
+
+    def join(self):
+        """
+        Wait until all the queued tasks are done
+        """
+        self.queue.join()
+
+
+def in_uncommittable_transaction(using=None):
+    """
+    True if a transaction is open that on_commit() can't wait for, ie. before Django 1.9
+    """
+    return not hasattr(transaction, 'on_commit') and \
+        transaction.get_connection(using).in_atomic_block
+
+
+def on_commit(func, using=None):
+    """
+    Call func() when the current transaction commits, or right away if there isn't one.
+
+    transaction.on_commit() is only in Django 1.9+; before that func() is called right away,
+    which is too early if the request is inside a transaction (eg. ATOMIC_REQUESTS), so that
+    case is logged.
+    """
+    hook = getattr(transaction, 'on_commit', None)
+    if hook:
+        hook(func, using=using)
+    else:
+        if in_uncommittable_transaction(using):
+            LOGGER.warning("Calling %s before the transaction commits",
+                           getattr(func, '__name__', func))
+        func()
+
+
+# The default executor
+executor = BackgroundExecutor()
+
+
+def defer(func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) in the default executor, once the current transaction commits
+    """
+    executor.submit_on_commit(func, *args, **kwargs)
+
+
+@contextmanager
+def synchronous(background_executor=executor):
+    """
+    Run the executor's tasks immediately within the block, eg. in a test
+    """
+    original = background_executor.synchronous
+    background_executor.synchronous = True
+    try:
+        yield background_executor
+    finally:
+        background_executor.synchronous = original
@@ -1,6 +1,10 @@
-from django.utils.translation import ugettext_lazy as _
+from django.utils.translation import ugettext_lazy as _, get_language
+from django.utils.encoding import force_text
 from django.db import models
+import bisect
 import iso3166
+import re
+import unicodedata
 
 # Override the displayed name for various countries
 # Note that this can affect the display order
@@ -39,7 +43,17 @@ COUNTRY_COMMON_NAMES.update(MULTIPLE_COUNTRIES)
 COUNTRY_COMMON_NAMES.update(ISO3166_ORGS)
 
 
-def get_country_name(country_code):
+COUNTRY_HELP_TEXT = " ".join([
+    'Country names and codes based on the',
+    '<a href="http://en.wikipedia.org/wiki/ISO_3166-1" target="_blank">',
+    'ISO 3166 standard</a>.'
+])
+
+
+def get_country_label(country_code):
+    """
+    Return the (lazily translated) name for a country code
+    """
     # Common name if it exists
     if country_code in COUNTRY_COMMON_NAMES:
         return COUNTRY_COMMON_NAMES[country_code]
@@ -51,40 +65,284 @@ def get_country_name(country_code):
     return country_code
 
 
-# Make a choice list, with US at the top and otherwise sorted by name
-COUNTRIES = [("US", get_country_name("US"))] + [
-    (country.alpha2, get_country_name(country.alpha2))
+# Make a choice list, with US at the top and otherwise in iso3166 order.
+# The labels are lazy, so this is fairly slow to render; see get_country_choices()
+COUNTRIES = [("US", get_country_label("US"))] + [
+    (country.alpha2, get_country_label(country.alpha2))
     for country in iso3166.countries
     if country.alpha2 != "US"
 ]
 
 
-class CountryField(models.CharField):
+#####
+# Per-language lookups
+#
+# Translating ~250 country names is slow enough to notice on every form render, so the names
+# and choice lists are built once for each language and shared by everything that needs them.
+#####
+
+# Language -> {code: name}
+_country_names = {}
+# (language, include_orgs, include_multiple) -> choice tuple
+_country_choices = {}
 
-    description = "A field of countries"
 
-    __metaclass__ = models.SubfieldBase
+def sort_key(name):
+    """
+    Key for sorting names, ignoring case and accents
+    """
+    return unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').lower()
 
-    def __init__(self, include_orgs=False, include_multiple=False, *args, **kwargs):
 
-        COUNTRY_HELP_TEXT = " ".join([
-            'Country names and codes based on the',
-            '<a href="http://en.wikipedia.org/wiki/ISO_3166-1" target="_blank">',
-            'ISO 3166 standard</a>.'
-        ])
+def get_country_names():
+    """
+    Return a dict of country code to name, in the active language.  This includes the orgs and
+    multiple country codes.  Don't modify it!
+    """
+    language = get_language()
+    names = _country_names.get(language)
+    if names is None:
+        names = dict(
+            (country.alpha2, force_text(get_country_label(country.alpha2)))
+            for country in iso3166.countries
+        )
+        for code, name in COUNTRY_COMMON_NAMES.items():
+            names[code] = force_text(name)
+        _country_names[language] = names
+    return names
 
-        choices = COUNTRIES
+
+def get_country_name(country_code):
+    """
+    Return the name of a country code in the active language, or the code itself if unknown
+    """
+    return get_country_names().get(country_code, country_code)
+
+
+def get_country_choices(include_orgs=False, include_multiple=False):
+    """
+    Return a tuple of (code, name) choices in the active language, with US at the top and
+    otherwise sorted by name.
+    """
+    key = (get_language(), include_orgs, include_multiple)
+    choices = _country_choices.get(key)
+    if choices is None:
+        names = get_country_names()
+        countries = sorted(
+            ((country.alpha2, names[country.alpha2])
+             for country in iso3166.countries
+             if country.alpha2 != "US"),
+            key=lambda choice: sort_key(choice[1])
+        )
+        choices = [("US", names["US"])] + countries
         if include_orgs:
-            choices += list(ISO3166_ORGS)
+            choices += [(code, names[code]) for code, name in ISO3166_ORGS]
         if include_multiple:
-            choices += list(MULTIPLE_COUNTRIES)
+            choices += [(code, names[code]) for code, name in MULTIPLE_COUNTRIES]
+        choices = tuple(choices)
+        _country_choices[key] = choices
+    return choices
+
+
+class CountryIndex(object):
+    """
+    Search index over a list of country choices.  A search term matches a country code
+    (alpha2, alpha3 or numeric) exactly, or the start of the name or any word in it, ignoring
+    case and accents.  Prefixes are found by bisecting sorted lists of the names and words,
+    so a search doesn't scan the list.
+    """
+
+    def __init__(self, choices):
+        self.choices = tuple(choices)
+        positions = dict((code, position) for position, (code, name) in enumerate(self.choices))
+        # Code -> position in the choices
+        self.codes = dict(positions)
+        for country in iso3166.countries:
+            if country.alpha2 in positions:
+                self.codes[country.alpha3] = positions[country.alpha2]
+                self.codes[country.numeric] = positions[country.alpha2]
+        # Sorted (key, position) lists, position is the country's place in the choices
+        self.names = []
+        self.words = []
+        for position, (code, name) in enumerate(self.choices):
+            key = sort_key(name)
+            self.names.append((key, position))
+            for word in re.split(r'[^a-z0-9]+', key)[1:]:
+                if word:
+                    self.words.append((word, position))
+        self.names.sort()
+        self.words.sort()
+
+    def _prefix_matches(self, index, prefix):
+        start = bisect.bisect_left(index, (prefix,))
+        # Index from `start` rather than slicing, which would copy the rest of the index
+        for i in xrange(start, len(index)):
+            key, position = index[i]
+            if not key.startswith(prefix):
+                break
+            yield position
+
+    def search(self, term):
+        """
+        Return a list of (code, name) choices matching the search term.  Code matches come
+        first, then names starting with the term, then names with a word starting with it.
+        """
+        term = term.strip()
+        if not term:
+            return list(self.choices)
+        positions = []
+        code = term.upper()
+        if code.isdigit():
+            code = code.zfill(3)
+        if code in self.codes:
+            positions.append(self.codes[code])
+        prefix = sort_key(force_text(term))
+        positions.extend(sorted(self._prefix_matches(self.names, prefix)))
+        positions.extend(sorted(self._prefix_matches(self.words, prefix)))
+        # Remove duplicates
+        seen = set()
+        return [
+            self.choices[p] for p in positions
+            if not (p in seen or seen.add(p))
+        ]
+
+
+# (language, include_orgs, include_multiple) -> CountryIndex
+_country_indexes = {}
+
+
+def get_country_index(include_orgs=False, include_multiple=False):
+    """
+    Return the CountryIndex for the given choices in the active language
+    """
+    key = (get_language(), include_orgs, include_multiple)
+    index = _country_indexes.get(key)
+    if index is None:
+        index = CountryIndex(get_country_choices(include_orgs, include_multiple))
+        _country_indexes[key] = index
+    return index
+
+
+class CountryChoices(object):
+    """
+    Iterable over the country choices in the active language, for use as a field's `choices`
+    """
+
+    def __init__(self, include_orgs=False, include_multiple=False):
+        self.include_orgs = include_orgs
+        self.include_multiple = include_multiple
+
+    def __iter__(self):
+        return iter(get_country_choices(self.include_orgs, self.include_multiple))
+
+    def __len__(self):
+        return len(get_country_choices(self.include_orgs, self.include_multiple))
+
+
+class Country(unicode):
+    """
+    A country code, with its name and flag.  This is what CountryField(compact=True) returns.
+
+    It is a unicode string, so it compares, hashes and saves like the plain code.  There is only
+    one instance for each code, so loading many rows doesn't create many objects.
+    """
+    __slots__ = ('flag_class', '_name')
+
+    _instances = {}
+
+    def __new__(cls, code):
+        instance = cls._instances.get(code)
+        if instance is None:
+            instance = unicode.__new__(cls, code)
+            # CSS class for the flags16.css sprite
+            instance.flag_class = 'flag16 %s' % code.lower()
+            instance._name = (None, None)
+            instance = cls._instances.setdefault(code, instance)
+        return instance
+
+    def __reduce__(self):
+        return (Country, (unicode(self),))
+
+    @property
+    def code(self):
+        return unicode(self)
+
+    @property
+    def name(self):
+        """
+        The name in the active language
+        """
+        language = get_language()
+        if self._name[0] != language:
+            self._name = (language, get_country_name(unicode(self)))
+        return self._name[1]
+
+
+class CountryField(models.CharField):
+    """
+    A field of country codes.  With compact=True, values are returned as Country objects.
+    """
+
+    description = "A field of countries"
+
+    def __init__(self, include_orgs=False, include_multiple=False, compact=False,
+                 *args, **kwargs):
+        self.include_orgs = include_orgs
+        self.include_multiple = include_multiple
+        self.compact = compact
 
         kwargs.setdefault('max_length', 2)
-        kwargs.setdefault('choices', choices)
+        kwargs.setdefault('choices', CountryChoices(include_orgs, include_multiple))
         kwargs.setdefault('help_text', COUNTRY_HELP_TEXT)
 
         super(CountryField, self).__init__(*args, **kwargs)
 
+    def from_db_value(self, value, expression, connection, context):
+        if value and self.compact:
+            return Country(value)
+        return value
+
+    def to_python(self, value):
+        value = super(CountryField, self).to_python(value)
+        if value and self.compact:
+            return Country(value)
+        return value
+
+    def get_prep_value(self, value):
+        value = super(CountryField, self).get_prep_value(value)
+        if isinstance(value, Country):
+            return unicode(value)
+        return value
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(CountryField, self).deconstruct()
+        # The choices are determined by these options
+        if isinstance(self.choices, CountryChoices):
+            kwargs.pop('choices', None)
+        if self.include_orgs:
+            kwargs['include_orgs'] = True
+        if self.include_multiple:
+            kwargs['include_multiple'] = True
+        if self.compact:
+            kwargs['compact'] = True
+        if kwargs.get('max_length') == 2:
+            del kwargs['max_length']
+        if kwargs.get('help_text') == COUNTRY_HELP_TEXT:
+            del kwargs['help_text']
+        return name, path, args, kwargs
+
+    def get_choices(self, include_blank=True, blank_choice=models.BLANK_CHOICE_DASH):
+        if include_blank:
+            return blank_choice + list(self.choices)
+        return list(self.choices)
+
+    def formfield(self, **kwargs):
+        if isinstance(self.choices, CountryChoices):
+            # A callable is evaluated each time a form is created, in that form's language
+            include_blank = self.blank or not (self.has_default() or 'initial' in kwargs)
+            kwargs.setdefault('choices', lambda: self.get_choices(include_blank=include_blank))
+        return super(CountryField, self).formfield(**kwargs)
+
     def get_internal_type(self):
         return "CharField"
 
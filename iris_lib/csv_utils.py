@@ -1,6 +1,23 @@
 import csv
 import cStringIO
 import codecs
+import datetime
+from decimal import Decimal, InvalidOperation
+from django.http.response import StreamingHttpResponse
+from django.utils.encoding import force_text
+from itertools import islice
+
+
+def encode_cell(value):
+    """
+    Encode a cell value as UTF-8 for the csv module.  Strings and numbers are passed
+    through (csv handles those itself); anything else is converted with unicode().
+    """
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    if value is None or isinstance(value, (str, int, long, float)):
+        return value
+    return unicode(value).encode("utf-8")
 
 
 class UnicodeWriter:
@@ -10,29 +27,396 @@ class UnicodeWriter:
 
     Copied from https://docs.python.org/2.7/library/csv.html
 
+    Cells may be unicode, str (assumed to be UTF-8), numbers, None (written as an empty cell)
+    or any other object, which is converted with unicode().
+
+    If the target encoding is UTF-8, the csv output is written to the stream as-is; otherwise
+    it is re-encoded.  writerows() writes `batch_size` rows at a time to the stream.
+
     If this is being sent in an HttpResponse, be sure to set the charset, eg:
     HttpResponse(csv_output, content_type='text/plain; charset=utf-8')
+
+    For large outputs, use iter_csv() with a StreamingHttpResponse (or queryset_csv_response())
+    rather than building the whole thing in memory.
     """
 
+    # Number of rows buffered between writes to the stream in writerows()
+    batch_size = 1000
+
     def __init__(self, f, dialect=csv.excel, encoding="utf-8", **kwds):
         # Redirect output to a queue
         self.queue = cStringIO.StringIO()
         self.writer = csv.writer(self.queue, dialect=dialect, **kwds)
         self.stream = f
+        self.is_utf8 = codecs.lookup(encoding).name == "utf-8"
         self.encoder = codecs.getincrementalencoder(encoding)()
 
-    def writerow(self, row):
-        self.writer.writerow([s.encode("utf-8") for s in row])
+    def flush(self):
+        """
+        Write anything in the queue to the target stream
+        """
         # Fetch UTF-8 output from the queue ...
         data = self.queue.getvalue()
-        data = data.decode("utf-8")
-        # ... and reencode it into the target encoding
-        data = self.encoder.encode(data)
+        if not data:
+            return
+        if not self.is_utf8:
+            # ... and reencode it into the target encoding
+            data = self.encoder.encode(data.decode("utf-8"))
         # write to the target stream
         self.stream.write(data)
         # empty queue
         self.queue.truncate(0)
 
+    def writerow(self, row):
+        self.writer.writerow([
+            s.encode("utf-8") if type(s) is unicode else encode_cell(s) for s in row
+        ])
+        self.flush()
+
     def writerows(self, rows):
+        writerow = self.writer.writerow
+        batch_size = self.batch_size
+        count = 0
         for row in rows:
-            self.writerow(row)
\ No newline at end of file
+            writerow([
+                s.encode("utf-8") if type(s) is unicode else encode_cell(s) for s in row
+            ])
+            count += 1
+            if count >= batch_size:
+                self.flush()
+                count = 0
+        self.flush()
+
+
+class StreamBuffer(object):
+    """
+    A file-like object that collects whatever is written to it until drained.  This lets a
+    UnicodeWriter feed a generator.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def drain(self):
+        data = ''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_csv(rows, header=None, encoding="utf-8", batch_size=UnicodeWriter.batch_size, **kwds):
+    """
+    Generator yielding CSV output for the given rows, `batch_size` rows at a time.
+    Extra arguments are passed to the UnicodeWriter.
+    """
+    buf = StreamBuffer()
+    writer = UnicodeWriter(buf, encoding=encoding, **kwds)
+    if header:
+        writer.writerow(header)
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        writer.writerows(batch)
+        yield buf.drain()
+    data = buf.drain()
+    if data:
+        yield data
+
+
+def get_pk_ordering(queryset):
+    """
+    If the queryset is unordered, return 'pk'; if it's ordered by primary key only, return 'pk'
+    or '-pk'; otherwise return None.
+    """
+    query = queryset.query
+    ordering = list(query.order_by or (query.default_ordering and queryset.model._meta.ordering)
+                    or [])
+    if not ordering:
+        return 'pk'
+    pk = queryset.model._meta.pk
+    if len(ordering) == 1 and isinstance(ordering[0], basestring) and \
+            ordering[0].lstrip('-') in ('pk', pk.name, pk.attname):
+        return '-pk' if ordering[0].startswith('-') else 'pk'
+    return None
+
+
+def iter_queryset_values(queryset, fields, chunk_size=2000):
+    """
+    Generator yielding a tuple of the given field values for each object in the queryset,
+    fetched `chunk_size` rows at a time, in the queryset's order.
+
+    If the queryset is unordered or ordered by primary key, this pages through the table by
+    primary key, so each query can use the primary key index; unordered rows come out in
+    primary key order.  Otherwise (eg. an admin changelist sorted by some column) it pages by
+    offset, with the primary key breaking ties, which gets slower further into a large table.
+
+    Fields may span relations (eg. 'institution__name') but should be single-valued, since
+    a row repeated by a multi-valued join can be split across pages.
+    """
+    pk_ordering = get_pk_ordering(queryset)
+    if pk_ordering is None:
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering) + ['pk']
+        queryset = queryset.order_by(*ordering).values_list(*fields)
+        offset = 0
+        while True:
+            page = list(queryset[offset:offset + chunk_size])
+            for row in page:
+                yield row
+            if len(page) < chunk_size:
+                break
+            offset += chunk_size
+        return
+    queryset = queryset.order_by(pk_ordering).values_list('pk', *fields)
+    after = 'pk__lt' if pk_ordering == '-pk' else 'pk__gt'
+    last_pk = None
+    while True:
+        if last_pk is None:
+            page = list(queryset[:chunk_size])
+        else:
+            page = list(queryset.filter(**{after: last_pk})[:chunk_size])
+        for row in page:
+            yield row[1:]
+        if len(page) < chunk_size:
+            break
+        last_pk = page[-1][0]
+
+
+def queryset_csv_response(queryset, fields, header=None, filename=None, encoding="utf-8",
+                          chunk_size=2000, **kwds):
+    """
+    Return a StreamingHttpResponse with the given fields of a queryset as CSV.  If
+    `filename` is given, the response is sent as an attachment.
+    """
+    response = StreamingHttpResponse(
+        iter_csv(iter_queryset_values(queryset, fields, chunk_size=chunk_size),
+                 header=header, encoding=encoding, **kwds),
+        content_type='text/csv; charset=%s' % encoding)
+    if filename:
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
+
+
+class UTF8Recoder:
+    """
+    Iterator that reads an encoded stream and reencodes the input to UTF-8
+
+    Copied from https://docs.python.org/2.7/library/csv.html
+    """
+
+    def __init__(self, f, encoding):
+        self.reader = codecs.getreader(encoding)(f)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self.reader.next().encode("utf-8")
+
+
+def iter_lines(f):
+    """
+    Iterate over the lines of a file-like object.  Objects that only support readline()
+    (eg. an mmap) are read a line at a time.
+    """
+    if hasattr(f, '__iter__'):
+        return iter(f)
+    return iter(f.readline, '')
+
+
+class UnicodeReader:
+    """
+    A CSV reader which will iterate over lines in the CSV file "f",
+    which is encoded in the given encoding.  Each row is a list of unicode strings.
+
+    Copied from https://docs.python.org/2.7/library/csv.html
+
+    UTF-8 input is parsed directly rather than being decoded and re-encoded.
+    """
+
+    def __init__(self, f, dialect=csv.excel, encoding="utf-8", **kwds):
+        if codecs.lookup(encoding).name == "utf-8":
+            lines = iter_lines(f)
+        else:
+            lines = UTF8Recoder(f, encoding)
+        self.reader = csv.reader(lines, dialect=dialect, **kwds)
+
+    @property
+    def line_num(self):
+        return self.reader.line_num
+
+    def next(self):
+        row = self.reader.next()
+        return [unicode(s, "utf-8") for s in row]
+
+    def __iter__(self):
+        return self
+
+
+#####
+# Column converters for TypedCSVReader
+#
+# Each converter takes the (unicode) cell value and returns the Python value.  Empty cells
+# become None.  Converters that need lookup tables build them once, when they're created.
+#####
+
+def text_converter(value):
+    return value
+
+
+def int_converter(value):
+    if value:
+        return int(value)
+
+
+def decimal_converter(value):
+    if value:
+        try:
+            return Decimal(value)
+        except InvalidOperation:
+            raise ValueError("Invalid decimal %s" % value)
+
+
+def bool_converter(value):
+    if value:
+        return value.strip().lower() in ('1', 'y', 'yes', 't', 'true')
+
+
+def date_converter(format='%Y-%m-%d'):
+    """
+    Return a converter parsing dates in the given format
+    """
+    strptime = datetime.datetime.strptime
+
+    def convert(value):
+        if value:
+            return strptime(value, format).date()
+    return convert
+
+
+def datetime_converter(format='%Y-%m-%dT%H:%M:%S'):
+    """
+    Return a converter parsing datetimes in the given format
+    """
+    strptime = datetime.datetime.strptime
+
+    def convert(value):
+        if value:
+            return strptime(value, format)
+    return convert
+
+
+def lookup_converter(lookup, name='value'):
+    """
+    Return a converter that maps the (case-insensitive) value through a dict
+    """
+    lookup = dict((force_text(k).lower(), v) for k, v in lookup.iteritems())
+
+    def convert(value):
+        if value:
+            try:
+                return lookup[value.strip().lower()]
+            except KeyError:
+                raise ValueError("Unknown %s %s" % (name, value))
+    return convert
+
+
+def choices_converter(choices_class):
+    """
+    Return a converter for a field_choices.Choices class, accepting either the choice
+    value or label
+    """
+    lookup = {}
+    for value, label in choices_class.get_localized_choices():
+        lookup[label] = value
+        lookup[value] = value
+    return lookup_converter(lookup, name='choice')
+
+
+def country_converter(include_orgs=True, include_multiple=True):
+    """
+    Return a converter for a country.CountryField, accepting a country code
+    (alpha2 or alpha3) or name
+    """
+    import iso3166
+    from iris_lib.country import get_country_choices
+    lookup = {}
+    for code, name in get_country_choices(include_orgs, include_multiple):
+        lookup[name] = code
+        lookup[code] = code
+    for country in iso3166.countries:
+        lookup.setdefault(country.name, country.alpha2)
+        lookup[country.alpha3] = country.alpha2
+    return lookup_converter(lookup, name='country')
+
+
+class TypedCSVReader(object):
+    """
+    Reads a CSV file, converting the declared columns to Python values, eg.
+
+    reader = TypedCSVReader(upload, [
+        ('name', text_converter),
+        ('founded', date_converter()),
+        ('country', country_converter()),
+        ('status', choices_converter(StatusChoices)),
+    ])
+    for batch in reader.batches(model=Institution, batch_size=1000):
+        Institution.objects.bulk_create(batch)
+
+    If the file has a header row, columns are matched to it by name (so the file may have
+    other columns, in any order); otherwise the columns are taken in order.
+
+    Iterating over the reader yields a tuple of values for each row.
+    """
+
+    def __init__(self, f, columns, header=True, dialect=csv.excel, encoding="utf-8", **kwds):
+        """
+        @param f: a file-like object (anything iterable by line, or supporting readline())
+        @param columns: a list of (name, converter) tuples; a plain name means text
+        @param header: whether the first row contains the column names
+        """
+        self.reader = UnicodeReader(f, dialect=dialect, encoding=encoding, **kwds)
+        self.names = []
+        self.converters = []
+        for column in columns:
+            if isinstance(column, basestring):
+                column = (column, text_converter)
+            self.names.append(column[0])
+            self.converters.append(column[1])
+        if header:
+            header_row = [name.strip() for name in self.reader.next()]
+            missing = [name for name in self.names if name not in header_row]
+            if missing:
+                raise ValueError("Missing columns: %s" % ', '.join(missing))
+            self.indexes = [header_row.index(name) for name in self.names]
+        else:
+            self.indexes = range(len(self.names))
+
+    def __iter__(self):
+        columns = zip(self.indexes, self.converters, self.names)
+        reader = self.reader
+        for row in reader:
+            if not row:
+                continue
+            try:
+                yield tuple([convert(row[index]) for index, convert, name in columns])
+            except (ValueError, IndexError) as e:
+                raise ValueError("Line %d: %s" % (reader.line_num, e))
+
+    def batches(self, batch_size=1000, model=None):
+        """
+        Yield lists of up to `batch_size` rows.  If `model` is given, each row is turned
+        into an (unsaved) instance of it, ready for bulk_create.
+        """
+        rows = iter(self)
+        if model:
+            names = self.names
+            rows = (model(**dict(zip(names, row))) for row in rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            yield batch
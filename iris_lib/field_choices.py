@@ -1,4 +1,10 @@
-from django.utils.translation import ugettext_lazy as _
+from django.db import models
+from django.db.models import Case, CharField, Value, When
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils.functional import cached_property
+from django.utils.encoding import force_text
+from django.utils.translation import ugettext_lazy as _, get_language
 
 ######
 #
@@ -18,7 +24,29 @@ from django.utils.translation import ugettext_lazy as _
 #
 # >>> # The choices can be returned in a format suitable for a Model field
 # >>> MyChoices.get_choices()
-# [('VALUE1', 'First Value'), ('VALUE2', 'Second Value')]
+# (('VALUE1', 'First Value'), ('VALUE2', 'Second Value'))
+#
+# >>> # Other lookups
+# >>> MyChoices.get_value('Second Value')
+# 'VALUE2'
+# >>> MyChoices.is_valid('VALUE3')
+# False
+# >>> MyChoices.get_index(MyChoices.VALUE2)
+# 1
+#
+# >>> # Labels can also be looked up in the database, eg. for sorting or values()
+# >>> MyChoices.annotate_labels(MyModel.objects.all(), 'status').order_by('status_label')
+#
+# >>> # Choices with declared codes can be stored compactly, see CompactChoicesField
+# >>> class Status(Choices):
+# ...    OPEN = Choice("Open", code=1)
+# ...    PENDING_REVIEW = Choice("Pending Review", code=2)
+# >>> status = CompactChoicesField(Status, default=Status.OPEN)
+#
+# A subclass has its parent's choices, followed by its own.
+#
+# The lookups are all built once per class (or per class and language), so they're cheap to
+# call; don't modify what they return.
 #
 ######
 
@@ -29,9 +57,11 @@ class Choice(object):
     # Global counter allows choices to be kept in order of definition
     _counter = 0
 
-    def __init__(self, label=None, value=None):
+    def __init__(self, label=None, value=None, code=None):
         self.label = label
         self.value = value
+        # Integer stored by a CompactChoicesField
+        self.code = code
         self._counter = Choice._counter
         Choice._counter += 1
 
@@ -41,7 +71,6 @@ class ChoicesMeta(type):
     Metaclass for a Choices type.
     """
     def __new__(cls, name, bases, attrs):
-        labels = {}
         # The choices are in the `attrs` dict; sort them by definition order
         ordered_choices = sorted(
             [(attr, choice) for attr, choice in attrs.iteritems() if isinstance(choice, Choice)],
@@ -57,10 +86,46 @@ class ChoicesMeta(type):
             value = choice.value
             # Set the actual class attributes to reflect the choice value
             attrs[attr] = attrs[value] = value
-            labels[attr] = labels[value] = choice.label
-        # Add the choices as an ordered list, and a label lookup dict, to the class attributes
+        # Inherited choices come first; these are already set up.  A choice redefined here
+        # replaces the inherited one, in the same position.
+        own_choices = dict(ordered_choices)
+        inherited_choices = []
+        inherited_attrs = set()
+        for base in bases:
+            for attr, choice in getattr(base, '_choices', ()):
+                if attr in inherited_attrs:
+                    continue
+                if attr in own_choices:
+                    choice = own_choices.pop(attr)
+                inherited_choices.append((attr, choice))
+                inherited_attrs.add(attr)
+        ordered_choices = tuple(
+            inherited_choices + [(attr, choice) for attr, choice in ordered_choices
+                                 if attr in own_choices])
+        labels = {}
+        codes = {}
+        code_values = {}
+        for attr, choice in ordered_choices:
+            labels[attr] = labels[choice.value] = choice.label
+            if choice.code is not None:
+                if choice.code in code_values:
+                    raise ValueError("%s: %s and %s have the same code %s" % (
+                        name, code_values[choice.code], choice.value, choice.code))
+                codes[choice.value] = choice.code
+                code_values[choice.code] = choice.value
+        values = tuple(choice.value for attr, choice in ordered_choices)
+        # Add the choices as an ordered list, and the lookups, to the class attributes
         attrs['_choices'] = ordered_choices
         attrs['_labels'] = labels
+        attrs['_choice_tuples'] = tuple(
+            (choice.value, choice.label) for attr, choice in ordered_choices)
+        attrs['_values'] = values
+        attrs['_value_set'] = frozenset(values)
+        attrs['_indexes'] = dict((value, i) for i, value in enumerate(values))
+        attrs['_codes'] = codes
+        attrs['_code_values'] = code_values
+        # Language -> lookups with translated labels, filled in as needed
+        attrs['_localized'] = {}
         return type.__new__(cls, name, bases, attrs)
 
 
@@ -77,14 +142,192 @@ class Choices(object):
 
     @classmethod
     def get_choices(cls):
-        choices = []
-        for attr, choice in cls._choices:
-            value = getattr(cls, attr)
-            label = choice.label
-            choices.append((value, label))
-        return choices
+        """
+        Return a tuple of (value, label), where the labels are lazily translated
+        """
+        return cls._choice_tuples
+
+    @classmethod
+    def _get_localized(cls):
+        """
+        Return (choices, label -> value dict) in the active language
+        """
+        language = get_language()
+        localized = cls._localized.get(language)
+        if localized is None:
+            choices = tuple((value, force_text(label)) for value, label in cls._choice_tuples)
+            lookup = {}
+            # If labels are repeated, the first one wins
+            for value, label in reversed(choices):
+                lookup[label] = value
+            localized = cls._localized[language] = (choices, lookup)
+        return localized
+
+    @classmethod
+    def get_localized_choices(cls):
+        """
+        Return a tuple of (value, label) with the labels in the active language
+        """
+        return cls._get_localized()[0]
 
     @classmethod
     def get_label(cls, attr):
         return cls._labels.get(attr)
 
+    @classmethod
+    def get_value(cls, label):
+        """
+        Return the value for a label (in the active language), or None
+        """
+        return cls._get_localized()[1].get(force_text(label))
+
+    @classmethod
+    def get_values(cls):
+        """
+        Return a tuple of the values, in order
+        """
+        return cls._values
+
+    @classmethod
+    def is_valid(cls, value):
+        return value in cls._value_set
+
+    @classmethod
+    def get_index(cls, value):
+        """
+        Return the position of a value in the choices, for sorting, or None
+        """
+        return cls._indexes.get(value)
+
+    @classmethod
+    def get_code(cls, value):
+        """
+        Return the declared code for a value, or None
+        """
+        return cls._codes.get(value)
+
+    @classmethod
+    def get_code_value(cls, code):
+        """
+        Return the value for a declared code, or None
+        """
+        return cls._code_values.get(code)
+
+    @classmethod
+    def get_label_expression(cls, field, default=None):
+        """
+        Return a database expression giving the label (in the active language) for the value
+        of `field`, or `default` if it isn't one of the choices.
+        """
+        return Case(
+            *[When(**{field: value, 'then': Value(label)})
+              for value, label in cls.get_localized_choices()],
+            default=Value(default),
+            output_field=CharField()
+        )
+
+    @classmethod
+    def annotate_labels(cls, queryset, field, name=None, default=None):
+        """
+        Annotate a queryset with the label for `field`, as `name` (by default `<field>_label`)
+        """
+        return queryset.annotate(**{
+            name or '%s_label' % field: cls.get_label_expression(field, default=default)
+        })
+
+
+def code_validator(choices_class, validator):
+    """
+    Return a validator that applies `validator` to the code of a choice value
+    """
+    def validate(value):
+        code = choices_class.get_code(value)
+        if code is not None:
+            validator(code)
+    return validate
+
+
+class CompactChoicesField(models.SmallIntegerField):
+    """
+    A field holding a Choices value, which is stored in the database as the choice's declared
+    integer code.  In Python (including queries) the value is the usual symbolic one:
+
+    >>> Ticket.objects.filter(status=Status.PENDING_REVIEW)
+
+    Every choice must declare a code, and the codes must never change once there's data.
+
+    Migrations don't refer to the Choices class, so they don't break if it changes; they record
+    the codes as plain integer choices.  Without a `choices_class` (ie. in a migration), the field
+    works with the codes.
+    """
+
+    description = "A Choices value, stored as an integer code"
+
+    def __init__(self, choices_class=None, *args, **kwargs):
+        if choices_class is not None:
+            missing = [value for value in choices_class.get_values()
+                       if choices_class.get_code(value) is None]
+            if missing:
+                raise ValueError("%s: no code declared for %s" % (
+                    choices_class.__name__, ', '.join(missing)))
+            kwargs.setdefault('choices', choices_class.get_choices())
+        self.choices_class = choices_class
+        super(CompactChoicesField, self).__init__(*args, **kwargs)
+
+    @cached_property
+    def validators(self):
+        # IntegerField checks that the value fits the database column, but the value here is
+        # symbolic (and in Python 2 a string compares as greater than any number); check the code
+        if self.choices_class is None:
+            return super(CompactChoicesField, self).validators
+        validators = []
+        for validator in super(CompactChoicesField, self).validators:
+            if isinstance(validator, (MinValueValidator, MaxValueValidator)):
+                validator = code_validator(self.choices_class, validator)
+            validators.append(validator)
+        return validators
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(CompactChoicesField, self).deconstruct()
+        choices_class = self.choices_class
+        if choices_class is not None:
+            kwargs['choices'] = [(choices_class.get_code(value), force_text(label))
+                                 for value, label in choices_class.get_choices()]
+            if 'default' in kwargs and not callable(kwargs['default']):
+                kwargs['default'] = choices_class.get_code(kwargs['default'])
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection, context):
+        if value is None or self.choices_class is None:
+            return value
+        return self.choices_class.get_code_value(value)
+
+    def to_python(self, value):
+        if self.choices_class is None:
+            return super(CompactChoicesField, self).to_python(value)
+        if value in (None, ''):
+            return value
+        if self.choices_class.is_valid(value):
+            return value
+        # Accept the code too, eg. from a fixture
+        try:
+            choice_value = self.choices_class.get_code_value(int(value))
+        except (TypeError, ValueError):
+            choice_value = None
+        if choice_value is None:
+            raise ValidationError(self.error_messages['invalid_choice'],
+                                  code='invalid_choice', params={'value': value})
+        return choice_value
+
+    def get_prep_value(self, value):
+        if value in (None, ''):
+            return None
+        if self.choices_class is None:
+            return super(CompactChoicesField, self).get_prep_value(value)
+        code = self.choices_class.get_code(value)
+        if code is None:
+            # Pass a valid code through, but nothing else
+            code = value
+            if self.choices_class.get_code_value(code) is None:
+                raise ValueError("Unknown %s value %r" % (self.choices_class.__name__, value))
+        return super(CompactChoicesField, self).get_prep_value(code)
@@ -1,6 +1,7 @@
 from django.utils.translation import ugettext_lazy as _
 from django.core.validators import RegexValidator
-from django.forms.models import ModelChoiceField, ModelMultipleChoiceField
+from django.forms.models import ModelChoiceField, ModelMultipleChoiceField, ModelChoiceIterator
+from iris_lib.select2widget import Select2Remote, Select2RemoteMultiple
 from email.utils import formataddr
 
 
@@ -69,3 +70,91 @@ class UserModelChoiceField(PrettifiedUserChoiceMixin, ModelChoiceField):
 
 class UserModelMultipleChoiceField(PrettifiedUserChoiceMixin, ModelMultipleChoiceField):
     pass
+
+
+#####
+# Lighter versions of the above for large user tables.  These only fetch the columns needed for
+# the labels, and cache the formatted labels.  Given a `remote_url` (eg. a views.UserLookupView)
+# they use a Select2 widget that searches as the user types, so the users aren't listed at all:
+#
+# class AssignForm(forms.Form):
+#     owner = LightUserModelChoiceField(User.objects.filter(is_active=True),
+#                                       remote_url=reverse_lazy('user_lookup'))
+#
+# The widget offers whatever the view finds, but the field only accepts users in its queryset, so
+# a field limited to some users needs a lookup view limited the same way, eg.
+#
+# url(r'^lookup/staff/$', UserLookupView.as_view(queryset=User.objects.filter(is_staff=True)),
+#     name='staff_lookup'),
+#####
+
+# User columns used for a label
+USER_LABEL_FIELDS = ('first_name', 'last_name', 'email')
+
+# Label cache, keyed by the label columns so it's never stale.  This is cleared when it gets
+# to USER_LABEL_CACHE_SIZE, which is crude but keeps the memory bounded.
+USER_LABEL_CACHE_SIZE = 50000
+_user_labels = {}
+
+
+def format_user_label(first_name, last_name, email):
+    """
+    Return the same label as PrettifiedUserChoiceMixin, from the column values
+    """
+    key = (first_name, last_name, email)
+    label = _user_labels.get(key)
+    if label is None:
+        if len(_user_labels) >= USER_LABEL_CACHE_SIZE:
+            _user_labels.clear()
+        full_name = ('%s %s' % (first_name, last_name)).strip()
+        label = _user_labels[key] = formataddr((full_name, email))
+    return label
+
+
+class UserValuesChoiceIterator(ModelChoiceIterator):
+    """
+    Choice iterator that reads the label columns with values_list(), rather than loading users
+    """
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        label_from_values = self.field.label_from_values
+        queryset = self.queryset.values_list('pk', *self.field.label_fields)
+        for row in queryset.iterator():
+            yield (row[0], label_from_values(*row[1:]))
+
+
+class LightUserChoiceMixin(PrettifiedUserChoiceMixin):
+    """
+    Mixin for a user ModelChoiceField that builds its choices from values_list() rows.  For a
+    custom user model, override `label_fields` and `label_from_values`.
+    """
+    label_fields = USER_LABEL_FIELDS
+    iterator = UserValuesChoiceIterator
+    remote_widget = Select2Remote
+
+    def __init__(self, queryset, *args, **kwargs):
+        """
+        @param remote_url: URL of a Select2 data source to search, instead of listing the users;
+            the data source should search the same queryset as the field (see above)
+        """
+        remote_url = kwargs.pop('remote_url', None)
+        if remote_url:
+            kwargs['widget'] = self.remote_widget(
+                remote_url, queryset=queryset, label_from_instance=self.label_from_instance)
+        super(LightUserChoiceMixin, self).__init__(queryset, *args, **kwargs)
+
+    def label_from_values(self, *values):
+        return format_user_label(*values)
+
+    def label_from_instance(self, obj):
+        return self.label_from_values(*[getattr(obj, f) for f in self.label_fields])
+
+
+class LightUserModelChoiceField(LightUserChoiceMixin, ModelChoiceField):
+    pass
+
+
+class LightUserModelMultipleChoiceField(LightUserChoiceMixin, ModelMultipleChoiceField):
+    remote_widget = Select2RemoteMultiple
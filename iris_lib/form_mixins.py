@@ -2,7 +2,7 @@ from django.utils.translation import ugettext as _
 from django.db import models
 from django.utils.log import getLogger
 from django.views.generic.edit import ModelFormMixin, FormMixin
-from django.http.response import HttpResponseRedirect
+from django.http.response import HttpResponseRedirect, HttpResponse
 import textile
 import re
 from textwrap import dedent
@@ -11,9 +11,17 @@ import crispy_forms
 from django.template.loader import render_to_string
 from crispy_forms.layout import TEMPLATE_PACK
 from crispy_forms.helper import FormHelper
+from iris_lib.background import executor
+from iris_lib.spam import score_submission
+from iris_lib.throttle import get_rate_limiter, THROTTLE_RATE, THROTTLE_CACHE
+from django.conf import settings
 
 LOGGER = getLogger(__name__)
 
+# Number of proxies in front of the site that add the client address to X-Forwarded-For.
+# Only the entries they added can be trusted, anything before that came from the client.
+TRUSTED_PROXY_COUNT = getattr(settings, 'TRUSTED_PROXY_COUNT', 0)
+
 class FormModelMixin(models.Model):
     """
     Mixin for a model saved from a form submission.  Includes an email address field (to be filled by the user)
@@ -56,7 +64,28 @@ class FormModelMixin(models.Model):
 class FormSaveMixin(FormMixin):
     """
     Mixin to save a validated form to an object, with pluggable functionality running before and after.
+
+    Slow work after saving (eg. sending notifications) can be run in the background instead of holding
+    up the response, by registering it from after_save():
+
+    def after_save(self):
+        self.defer_after_save(send_notification, self.object.pk)
+
+    The function runs in a background thread once the object is committed, so it should take simple
+    values (like the pk) rather than the object, the view or the request.  See background.py.
     """
+    # The background.BackgroundExecutor for deferred work, or None for the default one
+    background_executor = None
+
+    def get_background_executor(self):
+        return self.background_executor or executor
+
+    def defer_after_save(self, func, *args, **kwargs):
+        """
+        Register func(*args, **kwargs) to run in the background once the object is committed.
+        """
+        self.get_background_executor().submit_on_commit(func, *args, **kwargs)
+
     def before_save(self):
         """
         Called after the object has been successfully created from a form submission (but not yet saved).
@@ -87,13 +116,65 @@ class FormSaveMixin(FormMixin):
         return super(FormSaveMixin,self).form_valid(form)
 
 
-def get_request_ip_address(request):
+def get_request_ip_address(request, trusted_proxies=None):
+    """
+    Get the IP address of a request.  The client can put anything in X-Forwarded-For, so it's
+    only used if there are trusted proxies (TRUSTED_PROXY_COUNT); each of them appends the
+    address it received the request from, so the client address is the one the outermost
+    proxy appended.  Otherwise this is REMOTE_ADDR.
     """
-    Get the IP address of a request.  If the request was proxied, the original client address
-    will be listed under X-Forwarded-For, possibly followed by other intermediate proxy addresses.
+    if trusted_proxies is None:
+        trusted_proxies = TRUSTED_PROXY_COUNT
+    remote_addr = request.META.get('REMOTE_ADDR', '')
+    if trusted_proxies:
+        ip_list = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        ip_list = [ip for ip in ip_list if ip]
+        if ip_list:
+            # If the list is shorter, the request skipped some of the proxies
+            return ip_list[-min(trusted_proxies, len(ip_list))]
+    return remote_addr
+
+
+class ThrottleMixin(object):
+    """
+    Mixin for a class-based view that limits how often each IP address can submit (by default,
+    POST) to it, eg.
+
+    class ContactView(ThrottleMixin, SpamCheckMixin, CreateView):
+        throttle_rate = '5/m'
+
+    Requests over the limit get a 429 response, before the form is even looked at.  Each view class
+    is counted separately, unless views share a `throttle_scope`; see throttle.py for the settings.
     """
-    ip_list = request.META.get('HTTP_X_FORWARDED_FOR', request.META.get('REMOTE_ADDR'))
-    return ip_list.split(',')[0]
+    throttle_rate = THROTTLE_RATE
+    throttle_cache = THROTTLE_CACHE
+    throttle_methods = ('POST',)
+    # Views with the same scope share a limit; by default, the view class name
+    throttle_scope = None
+
+    def get_throttle_scope(self):
+        return self.throttle_scope or type(self).__name__
+
+    def get_throttle_key(self):
+        return '%s:%s' % (self.get_throttle_scope(), get_request_ip_address(self.request))
+
+    def get_rate_limiter(self):
+        return get_rate_limiter(self.throttle_rate, self.throttle_cache)
+
+    def throttled(self):
+        """
+        Return the response for a request over the limit
+        """
+        return HttpResponse(_('Too many requests, please try again later.'), status=429,
+                            content_type='text/plain')
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in self.throttle_methods:
+            key = self.get_throttle_key()
+            if not self.get_rate_limiter().allow(key):
+                LOGGER.warning("Throttled %s from %s", request.path, key)
+                return self.throttled()
+        return super(ThrottleMixin, self).dispatch(request, *args, **kwargs)
 
 
 class SpamCheckMixin(FormSaveMixin):
@@ -101,6 +182,9 @@ class SpamCheckMixin(FormSaveMixin):
     Mixin for a class-based view whose model uses FormModelMixin; this provides functions to record
     the request IP address and calculate the spam score based on that and the user email.
     This requires a model object that has `ip_address`, `email` and `spam_score` fields.
+
+    The spam score is calculated in the background after the object is saved (see spam.py), so
+    `spam_score` is empty until then.
     """
 
     def add_ip_address(self):
@@ -111,24 +195,24 @@ class SpamCheckMixin(FormSaveMixin):
 
     def spam_check(self):
         """
-        Check the requester IP address and email against spam database
+        Check the requester IP address and email against spam database, once the object is saved
         """
-        # This is disabled because it doesn't actually work very well
-        # try:
-        #     spam_score = 0
-        #     for spam_field in (self.object.ip_address, self.object.email):
-        #         score = stopspam.confidence(spam_field)
-        #         if score > spam_score:
-        #             spam_score = score
-        #     self.object.spam_score = int(spam_score)
-        # except Exception as e:
-        #     LOGGER.error("Failed to run spam check: %s", e)
+        self.defer_after_save(score_submission, type(self.object), self.object.pk,
+                              self.object.ip_address, self.object.email)
 
     def before_save(self):
         """
-        Add the IP address and perform a spam check before saving.
+        Add the IP address before saving.
         """
         self.add_ip_address()
-        self.spam_check()
         super(SpamCheckMixin,self).before_save()
 
+    def form_valid(self, form):
+        """
+        Perform a spam check once the form is saved.  This comes after everything else in
+        form_valid(), since ModelFormMixin (eg. in a CreateView) saves the object again, and
+        would overwrite the score if it had already been set.
+        """
+        response = super(SpamCheckMixin,self).form_valid(form)
+        self.spam_check()
+        return response
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from iris_lib.ws_client.cache_warmer import cache_warmer
+
+
+class Command(BaseCommand):
+    help = "Keep the registered web service requests warm in the cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', default=False,
+                            help="Refresh every registered request once and exit")
+        parser.add_argument('--max-sleep', type=int, default=60,
+                            help="Maximum number of seconds to sleep between checks")
+
+    def handle(self, *args, **options):
+        if not cache_warmer.requests:
+            self.stderr.write("No web service requests are registered")
+            return
+        if options['once']:
+            refreshed = cache_warmer.run_pending()
+            self.stdout.write("Refreshed %d requests" % refreshed)
+        else:
+            cache_warmer.run_forever(max_sleep=options['max_sleep'])
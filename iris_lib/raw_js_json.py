@@ -1,4 +1,5 @@
 import json
+import re
 import uuid
 
 #######
@@ -9,12 +10,17 @@ import uuid
 #     'success': RawJavaScriptText('function(data) { console.log("Success!"); }')
 # }
 #
-# This works by using a UUID value as a placeholder, and then substituting the
-# raw Javascript in at the very end.
+# This works by encoding each RawJavaScriptText as a placeholder string, and then substituting the
+# raw Javascript in at the very end.  The placeholders are a random prefix (generated once) plus
+# a counter, so all of them are replaced in a single pass over the output.  When streaming with
+# iterencode(), each placeholder comes out as its own chunk and is replaced as it goes by.
 #
 # See http://stackoverflow.com/questions/13188719
 #######
 
+_PLACEHOLDER_PREFIX = uuid.uuid4().hex
+_PLACEHOLDER_RE = re.compile(r'"%s_\d+"' % _PLACEHOLDER_PREFIX)
+
 
 class RawJavaScriptText:
     def __init__(self, jstext):
@@ -26,18 +32,27 @@ class RawJavaScriptText:
 class RawJsJSONEncoder(json.JSONEncoder):
     def __init__(self, *args, **kwargs):
         json.JSONEncoder.__init__(self, *args, **kwargs)
+        # Map of (quoted) placeholder to raw Javascript
         self._replacement_map = {}
 
     def default(self, o):
         if isinstance(o, RawJavaScriptText):
-            key = uuid.uuid4().hex
-            self._replacement_map[key] = o.get_jstext()
+            key = '%s_%d' % (_PLACEHOLDER_PREFIX, len(self._replacement_map))
+            self._replacement_map['"%s"' % (key,)] = o.get_jstext()
             return key
         else:
             return json.JSONEncoder.default(self, o)
 
     def encode(self, o):
         result = json.JSONEncoder.encode(self, o)
-        for k, v in self._replacement_map.iteritems():
-            result = result.replace('"%s"' % (k,), v)
+        if self._replacement_map:
+            result = _PLACEHOLDER_RE.sub(lambda m: self._replacement_map[m.group(0)], result)
         return result
+
+    def iterencode(self, o, _one_shot=False):
+        chunks = json.JSONEncoder.iterencode(self, o, _one_shot)
+        if _one_shot:
+            # Called from encode(), which does the substitution
+            return chunks
+        replacement_map = self._replacement_map
+        return (replacement_map.get(chunk, chunk) for chunk in chunks)
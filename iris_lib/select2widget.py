@@ -2,9 +2,13 @@ from django.conf import settings
 from django import forms
 import copy
 import json
-from iris_lib.raw_js_json import RawJsJSONEncoder
+from iris_lib.country import get_country_name
+from iris_lib.raw_js_json import RawJsJSONEncoder, RawJavaScriptText
 from django.utils.safestring import mark_safe
 from django.templatetags.static import static
+from django.utils.encoding import force_text
+from django.utils.functional import Promise
+from django.utils.translation import get_language
 
 
 SELECT2_JS = getattr(settings, 'SELECT2_JS',
@@ -23,6 +27,9 @@ SELECT2_WIDGET_CSS = [
     static('select2/css/select2custom.css'),
 ]
 
+# Related tables with more rows than this use Select2Remote in Select2AdminMixin; None to disable
+SELECT2_REMOTE_THRESHOLD = getattr(settings, 'SELECT2_REMOTE_THRESHOLD', 1000)
+
 SELECT2_DEFAULT_ATTRS = getattr(settings, 'SELECT2_DEFAULT_ATTRS', {
     'width': 'auto',
     'min-width': '250px',
@@ -30,6 +37,55 @@ SELECT2_DEFAULT_ATTRS = getattr(settings, 'SELECT2_DEFAULT_ATTRS', {
     'selectOnBlur': True,
 })
 
+# If True, each widget renders an inline script to initialize itself.  If False, widgets carry their
+# options in a `data-select2-options` attribute, and are all initialized by one page-level handler
+# in select2custom.js.  (Widgets whose options include raw Javascript always use an inline script.)
+SELECT2_USE_INLINE_SCRIPT = getattr(settings, 'SELECT2_USE_INLINE_SCRIPT', True)
+
+# Serialized options, keyed by the frozen select2attrs and language.  This is cleared when it gets
+# to SELECT2_OPTIONS_CACHE_SIZE, since select2attrs can include per-widget values (eg. URLs).
+SELECT2_OPTIONS_CACHE_SIZE = 1000
+_select2_options_cache = {}
+
+
+def freeze_select2attrs(value):
+    """
+    Return a hashable version of a select2attrs value, and whether it contains raw Javascript
+    """
+    if isinstance(value, dict):
+        items = [(k, freeze_select2attrs(v)) for k, v in value.items()]
+        items.sort()
+        return (dict, tuple((k, v[0]) for k, v in items)), any(v[1] for k, v in items)
+    if isinstance(value, (list, tuple)):
+        items = [freeze_select2attrs(v) for v in value]
+        return (list, tuple(v[0] for v in items)), any(v[1] for v in items)
+    if isinstance(value, RawJavaScriptText):
+        return (RawJavaScriptText, value.get_jstext()), True
+    if isinstance(value, Promise):
+        value = force_text(value)
+    # Tag with the type, since eg. True, 1 and 1.0 are equal but serialize differently
+    return (type(value), value), False
+
+
+def get_select2_options(select2attrs):
+    """
+    Return (JSON-serialized options, whether they contain raw Javascript) for a select2attrs dict.
+    This is cached for each distinct configuration.
+    """
+    frozen, has_raw_js = freeze_select2attrs(select2attrs)
+    key = (frozen, get_language())
+    try:
+        return _select2_options_cache[key]
+    except TypeError:
+        # Something unhashable, don't cache
+        return json.dumps(select2attrs, cls=RawJsJSONEncoder), has_raw_js
+    except KeyError:
+        options = (json.dumps(select2attrs, cls=RawJsJSONEncoder), has_raw_js)
+        if len(_select2_options_cache) >= SELECT2_OPTIONS_CACHE_SIZE:
+            _select2_options_cache.clear()
+        _select2_options_cache[key] = options
+        return options
+
 
 class Select2CustomMixin(object):
     """
@@ -51,7 +107,12 @@ class Select2CustomMixin(object):
         </script>
     """
 
+    use_inline_script = SELECT2_USE_INLINE_SCRIPT
+
     def __init__(self, select2attrs=None, *args, **kwargs):
+        use_inline_script = kwargs.pop('use_inline_script', None)
+        if use_inline_script is not None:
+            self.use_inline_script = use_inline_script
         self.select2attrs = copy.copy(SELECT2_DEFAULT_ATTRS)
         if select2attrs:
             self.select2attrs.update(select2attrs)
@@ -60,11 +121,16 @@ class Select2CustomMixin(object):
     def render(self, *args, **kwargs):
         """
         Extend base class's `render` method by appending
-        javascript inline text to html output.
+        javascript inline text to html output, or adding the options as a data attribute.
         """
+        options, has_raw_js = get_select2_options(self.select2attrs)
+        if not (self.use_inline_script or has_raw_js):
+            attrs = dict(kwargs.get('attrs') or {})
+            attrs['data-select2-options'] = options
+            kwargs['attrs'] = attrs
+            return super(Select2CustomMixin, self).render(*args, **kwargs)
         output = super(Select2CustomMixin, self).render(*args, **kwargs)
         id_ = kwargs['attrs']['id']
-        options = json.dumps(self.select2attrs, cls=RawJsJSONEncoder)
         output += self.inline_script % {
             'id': id_,
             'options': options,
@@ -97,3 +163,101 @@ class Select2TextInput(Select2TextMixin, forms.TextInput):
     """Adds Select2 to TextInput"""
     pass
 
+
+class Select2RemoteMixin(Select2CustomMixin):
+    """
+    Mixin for a Select2 widget that fetches its options from a remote data source (eg. a
+    views.Select2LookupView) as the user types, rather than rendering every option.  Only the
+    current value(s) are looked up when rendering.
+
+    Select2 needs a hidden input to use remote data, so the value is rendered as a comma-separated
+    list of ids, with the labels for the current value(s) in a `data-select2-initial` attribute.
+    """
+    # Select2 hides the input itself, the form should still render it as a visible field
+    input_type = 'hidden'
+    is_hidden = False
+    # Milliseconds to wait after a keystroke before querying
+    remote_delay = 250
+    multiple = False
+
+    def __init__(self, url, queryset=None, label_from_instance=None, select2attrs=None,
+                 *args, **kwargs):
+        """
+        @param url: the URL of the data source
+        @param queryset: the queryset to look up the labels for the current value(s) from
+        @param label_from_instance: function returning the label for an object
+        """
+        super(Select2RemoteMixin, self).__init__(select2attrs, *args, **kwargs)
+        self.url = url
+        self.queryset = queryset
+        if label_from_instance:
+            self.label_from_instance = label_from_instance
+        self.select2attrs.update({
+            'remoteUrl': url,
+            'remoteDelay': self.remote_delay,
+            'multiple': self.multiple,
+        })
+
+    def label_from_instance(self, obj):
+        return force_text(obj)
+
+    def get_values(self, value):
+        if not value:
+            return []
+        if isinstance(value, basestring):
+            value = value.split(',')
+        elif not isinstance(value, (list, tuple)):
+            value = [value]
+        return [force_text(v) for v in value if v not in ('', None)]
+
+    def get_initial(self, values):
+        """
+        Return a list of (id, label) for the given values
+        """
+        if not values or self.queryset is None:
+            return [(v, v) for v in values]
+        objects = self.queryset.in_bulk(values)
+        labels = dict((force_text(pk), self.label_from_instance(obj)) for pk, obj in objects.items())
+        return [(v, labels.get(v, v)) for v in values]
+
+    def render(self, name, value, attrs=None):
+        # Note that resolving the URL is deferred to render time, so the widget can be created
+        # before the URLconf is loaded (eg. with reverse_lazy)
+        self.select2attrs['remoteUrl'] = force_text(self.url)
+        values = self.get_values(value)
+        attrs = dict(attrs or {})
+        attrs['data-select2-initial'] = json.dumps([
+            {'id': id_, 'text': force_text(text)} for id_, text in self.get_initial(values)
+        ])
+        return super(Select2RemoteMixin, self).render(name, ','.join(values), attrs=attrs)
+
+
+class Select2Remote(Select2RemoteMixin, forms.TextInput):
+    """Select2 with remote data, for a single value"""
+    pass
+
+
+class Select2RemoteMultiple(Select2RemoteMixin, forms.TextInput):
+    """Select2 with remote data, for multiple values"""
+    multiple = True
+
+    def value_from_datadict(self, data, files, name):
+        value = data.get(name)
+        if value:
+            return value.split(',')
+        return []
+
+
+class CountrySelect2Remote(Select2Remote):
+    """
+    Select2 widget for a CountryField that searches a views.CountryLookupView, eg.
+
+    class InstitutionForm(forms.ModelForm):
+        class Meta:
+            widgets = {
+                'country': CountrySelect2Remote(reverse_lazy('country_lookup')),
+            }
+    """
+
+    def get_initial(self, values):
+        return [(v, get_country_name(v)) for v in values]
@@ -0,0 +1,202 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.utils.log import getLogger
+from django.utils.module_loading import import_string
+import hashlib
+import math
+import struct
+import threading
+import time
+
+LOGGER = getLogger(__name__)
+
+###
+# Spam scoring for form submissions (see form_mixins.SpamCheckMixin).
+#
+# A submission's IP address and email are each scored 0-100, and the submission gets the highest
+# score.  Anything in the local blocklist scores 100 without asking the service; otherwise the
+# service is asked, and its answers are cached for a while.  Settings:
+#
+# SPAM_SERVICE = 'iris_lib.spam.StopSpamService'
+# SPAM_BLOCKLIST = ['192.0.2.1', 'spammer.example.com']  # IP addresses and email domains
+# SPAM_CACHE_TIMEOUT = 3600
+#
+# The default service is a local stub, which only knows what it's told, so only the blocklist
+# has any effect.
+###
+
+SPAM_SERVICE = getattr(settings, 'SPAM_SERVICE', 'iris_lib.spam.StubSpamService')
+SPAM_BLOCKLIST = getattr(settings, 'SPAM_BLOCKLIST', ())
+SPAM_CACHE_TIMEOUT = getattr(settings, 'SPAM_CACHE_TIMEOUT', 3600)
+
+
+class BloomFilter(object):
+    """
+    Compact set membership test.  This never misses an item that was added, but may (with
+    probability `error_rate`, once `capacity` items are added) claim to contain one that wasn't.
+    """
+
+    def __init__(self, capacity=10000, error_rate=0.001, items=None):
+        # Standard sizing for the number of bits and hashes
+        self.size = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        for item in items or ():
+            self.add(item)
+
+    def _positions(self, item):
+        if isinstance(item, unicode):
+            item = item.encode('utf-8')
+        # Derive all the hashes from two (double hashing)
+        h1, h2 = struct.unpack('<QQ', hashlib.md5(item).digest())
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class TTLCache(object):
+    """
+    Thread-safe dict-like cache whose entries expire after `timeout` seconds.  At most
+    `max_entries` are kept; the oldest are dropped first.
+    """
+
+    def __init__(self, timeout=SPAM_CACHE_TIMEOUT, max_entries=10000):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if entry[0] < time.time():
+                del self._data[key]
+                return default
+            return entry[1]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (now + self.timeout, value)
+            # Entries are in order of expiry, so drop from the front
+            data = self._data
+            while data and (len(data) > self.max_entries or next(data.itervalues())[0] < now):
+                data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class StubSpamService(object):
+    """
+    Local stand-in for a reputation service, scoring values from a dict
+    """
+
+    def __init__(self, scores=None, default=0):
+        self.scores = dict(scores or {})
+        self.default = default
+        # Number of lookups made, for testing
+        self.lookups = 0
+
+    def score(self, value):
+        self.lookups += 1
+        return self.scores.get(value, self.default)
+
+
+class StopSpamService(object):
+    """
+    Scores values with the `stopspam` package (which must be installed)
+    """
+
+    def score(self, value):
+        import stopspam
+        return stopspam.confidence(value)
+
+
+def get_domain(email):
+    """
+    Return the (lowercased) domain of an email address
+    """
+    return email.rpartition('@')[2].lower()
+
+
+class SpamScorer(object):
+    """
+    Scores submissions, using a blocklist, a cache and a service
+    """
+
+    def __init__(self, service=None, blocklist=SPAM_BLOCKLIST, cache_timeout=SPAM_CACHE_TIMEOUT):
+        """
+        @param service: object with a score(value) method returning 0-100
+        @param blocklist: IP addresses and email domains that always score 100
+        """
+        if service is None:
+            service = import_string(SPAM_SERVICE)()
+        self.service = service
+        blocklist = list(blocklist)
+        self.blocklist = BloomFilter(capacity=max(1000, len(blocklist)), items=blocklist)
+        self.cache = TTLCache(cache_timeout)
+
+    def is_blocked(self, value):
+        return value in self.blocklist
+
+    def score_value(self, value):
+        """
+        Return the score for a single value, or None if the service failed
+        """
+        score = self.cache.get(value)
+        if score is None:
+            try:
+                score = int(self.service.score(value))
+            except Exception as e:
+                LOGGER.error("Failed to get spam score for %s: %s", value, e)
+                return None
+            self.cache.set(value, score)
+        return score
+
+    def score(self, ip_address=None, email=None):
+        """
+        Return the spam score for a submission, or None if it couldn't be scored
+        """
+        if (ip_address and self.is_blocked(ip_address)) or \
+                (email and self.is_blocked(get_domain(email))):
+            return 100
+        scores = [self.score_value(value) for value in (ip_address, email) if value]
+        scores = [score for score in scores if score is not None]
+        if not scores:
+            return None
+        return max(scores)
+
+
+_scorer = None
+
+
+def get_spam_scorer():
+    """
+    Return the default SpamScorer
+    """
+    global _scorer
+    if _scorer is None:
+        _scorer = SpamScorer()
+    return _scorer
+
+
+def score_submission(model, pk, ip_address, email):
+    """
+    Score a saved submission, and update its spam_score.  This is meant to run in the
+    background (see SpamCheckMixin), so it updates the one column rather than saving the object.
+    """
+    score = get_spam_scorer().score(ip_address, email)
+    if score is not None:
+        model._default_manager.filter(pk=pk).update(spam_score=score)
+    return score
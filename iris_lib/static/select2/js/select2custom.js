@@ -118,6 +118,30 @@
                 opts.data = { results: [{text: groupName, children: data}]};
             }
         }
+        // Fetch results from a remote data source (see Select2RemoteMixin)
+        if (opts.remoteUrl) {
+            if (!opts.ajax) {
+                opts.ajax = {
+                    url: opts.remoteUrl,
+                    dataType: 'json',
+                    // Debounce the queries while the user is typing
+                    quietMillis: opts.remoteDelay || 250,
+                    data: function(term, page) {
+                        return { q: term, page: page };
+                    },
+                    results: function(data, page) {
+                        return data;
+                    }
+                };
+            }
+            // The current value(s) are rendered with the widget
+            if (!opts.initSelection) {
+                opts.initSelection = function(element, callback) {
+                    var initial = $(element).data('select2Initial') || [];
+                    callback(opts.multiple ? initial : (initial[0] || null));
+                };
+            }
+        }
         // If no sorting specified, sort 0-index matches highest
         if (!opts.sortResults) {
             opts.sortResults = function(results, container, query) {
@@ -136,8 +160,34 @@
         return opts;
     }
 
+    // Initialize a widget whose options are in its `data-select2-options` attribute
+    function initWidget(el) {
+        var $el = $(el);
+        // Skip the template row of admin inline formsets
+        if ((el.id || '').indexOf('__prefix__') >= 0) { return; }
+        $el.select2(prepareOpts($.extend({}, $el.data('select2Options'))));
+    }
+
+    // Initialize all the data-attribute widgets in the container (by default, the whole page).
+    // Call this after dynamically adding widgets (eg. new inline formset rows).
+    function initAll(container) {
+        $('[data-select2-options]', container || document).each(function() {
+            initWidget(this);
+        });
+    }
+
+    // One handler for the whole page, rather than one inline script per widget
+    $(function() {
+        initAll();
+    });
+    $(document).on('select2changed', '[data-select2-options]', function() {
+        initWidget(this);
+    });
+
     window.Select2Custom = {
-        'prepareOpts': prepareOpts
+        'prepareOpts': prepareOpts,
+        'initWidget': initWidget,
+        'initAll': initAll
     };
 
 }(jQuery));
@@ -0,0 +1,77 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.http.response import StreamingHttpResponse
+from django.template.loader import get_template, select_template
+from django.utils.safestring import mark_safe
+import uuid
+
+
+class StreamingTemplateMixin(object):
+    """
+    Mixin for a TemplateView whose page contains a (potentially long and slow) list of rows,
+    typically generated from a web service request.  The page template is rendered immediately
+    with a placeholder where the rows go; everything before the placeholder is sent right away,
+    then each row is rendered with `row_template_name` and sent as it comes in.
+
+    The page template should output `{{ rows }}` (or whatever `rows_context_name` is) where
+    the rows belong, eg.
+
+    <tbody>
+        {{ rows }}
+    </tbody>
+
+    The row template is rendered with the page context plus `row` (or `row_context_name`).
+    """
+    row_template_name = None
+    rows_context_name = 'rows'
+    row_context_name = 'row'
+    # Number of rows to render before sending them on
+    rows_per_chunk = 10
+
+    def get_rows(self):
+        """
+        Return an iterable of the rows.  The subclass must implement this.
+        """
+        raise NotImplementedError()
+
+    def get_row_template(self):
+        if not self.row_template_name:
+            raise Exception("This class must define a row_template_name")
+        return get_template(self.row_template_name)
+
+    def render_to_response(self, context, **response_kwargs):
+        """
+        Return a StreamingHttpResponse rendering the page around the rows
+        """
+        placeholder = uuid.uuid4().hex
+        context[self.rows_context_name] = mark_safe(placeholder)
+        template = select_template(self.get_template_names())
+        page = template.render(context, self.request)
+        if placeholder not in page:
+            raise ImproperlyConfigured("Template %s doesn't output {{ %s }}" % (
+                getattr(getattr(template, 'template', None), 'name', None) or
+                ', '.join(self.get_template_names()), self.rows_context_name))
+        head, tail = page.split(placeholder, 1)
+        response_kwargs.setdefault('content_type', self.content_type)
+        return StreamingHttpResponse(
+            self.stream_page(head, tail, context),
+            **response_kwargs
+        )
+
+    def stream_page(self, head, tail, context):
+        """
+        Generator yielding the page head, the rendered rows and the page tail
+        """
+        yield head
+        # Rows don't need the placeholder
+        context.pop(self.rows_context_name, None)
+        row_template = self.get_row_template()
+        chunk = []
+        for row in self.get_rows():
+            context[self.row_context_name] = row
+            chunk.append(row_template.render(context, self.request))
+            if len(chunk) >= self.rows_per_chunk:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+        yield tail
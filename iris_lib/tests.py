@@ -5,8 +5,10 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.template import Template, Context
+from decimal import Decimal
+import datetime
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -48,3 +50,782 @@ Item 3
 
         self.assertEqual(output, expected_output)
 
+
+
+class EventStatsTest(TestCase):
+    """
+    Test the aggregated event statistics
+    """
+
+    def test_merge(self):
+        from iris_lib.ws_client.events import Event
+        from iris_lib.ws_client.stats import EventStats
+        events = [
+            Event({'EventID': '1', 'Time': '2015-01-01T03:04:05', 'Latitude': '-19.5',
+                   'Longitude': '-179.9', 'Magnitude': '4.7'}),
+            Event({'EventID': '2', 'Time': '2015-01-02T06:00:00', 'Latitude': '10.1',
+                   'Longitude': '20', 'Magnitude': '5.0'}),
+        ]
+        stats = EventStats(grid_size=5).update(events[:1]) + EventStats(grid_size=5).update(events[1:])
+        self.assertEqual(stats.count, 2)
+        self.assertEqual(stats.magnitudes, {Decimal('4.5'): 1, Decimal('5.0'): 1})
+        self.assertEqual(stats.sorted_times(), [(datetime.date(2015, 1, 1), 1), (datetime.date(2015, 1, 2), 1)])
+        self.assertEqual(stats.grid[(-20, -180)], 1)
+        self.assertEqual(stats.cumulative_magnitudes(), [(Decimal('4.5'), 2), (Decimal('5.0'), 1)])
+        self.assertRaises(ValueError, stats.merge, EventStats(grid_size=1))
+
+    def test_columns(self):
+        from iris_lib.ws_client.stats import EventStats
+
+        class MyStats(EventStats):
+            pass
+
+        # Magnitudes only
+        stats = MyStats().update_columns([Decimal('4.7'), Decimal('5.2')])
+        self.assertEqual((stats.count, stats.magnitudes), (2, {Decimal('4.5'): 1, Decimal('5.0'): 1}))
+        self.assertEqual(stats.times, {})
+        other = MyStats().update_rows([(None, datetime.datetime(2015, 1, 1, 3), 1.5, 2.5)])
+        self.assertEqual(other.grid, {(1, 2): 1})
+        combined = stats + other
+        self.assertIsInstance(combined, MyStats)
+        self.assertEqual(combined.count, 3)
+        self.assertRaises(ValueError, EventStats().update_columns)
+
+
+class EventExportTest(TestCase):
+    """
+    Test the streaming JSON export of events
+    """
+
+    def test_formats(self):
+        import json
+        from iris_lib.ws_client.events import Event
+        from iris_lib.ws_client.export import iter_events
+        events = [
+            Event({'EventID': str(i), 'Time': '2015-01-01T03:04:05', 'Latitude': '-19.5',
+                   'Longitude': '-179.9', 'Magnitude': '4.7'})
+            for i in range(5)
+        ]
+        chunks = list(iter_events(events, chunk_size=2))
+        self.assertTrue(len(chunks) > 1)
+        data = json.loads(''.join(chunks))
+        self.assertEqual([e['event_id'] for e in data], range(5))
+        self.assertEqual(data[0]['magnitude'], 4.7)
+        self.assertEqual(data[0]['time'], '2015-01-01T03:04:05')
+
+        lines = ''.join(iter_events(events, format='ndjson')).splitlines()
+        self.assertEqual(json.loads(lines[4])['event_id'], 4)
+
+        geojson = json.loads(''.join(iter_events(events, format='geojson')))
+        self.assertEqual(len(geojson['features']), 5)
+        self.assertEqual(geojson['features'][0]['geometry']['coordinates'], [-179.9, -19.5])
+
+        self.assertEqual(json.loads(''.join(iter_events([]))), [])
+
+
+class UnicodeWriterTest(TestCase):
+    """
+    Test csv_utils.UnicodeWriter
+    """
+
+    def test_encodings(self):
+        import cStringIO
+        from iris_lib.csv_utils import UnicodeWriter
+        rows = [[u'S\xe3o Paulo', 1, None, Decimal('2.5')], ['plain', u'x']]
+        output = cStringIO.StringIO()
+        UnicodeWriter(output).writerows(rows)
+        self.assertEqual(output.getvalue(), 'S\xc3\xa3o Paulo,1,,2.5\r\nplain,x\r\n')
+        output = cStringIO.StringIO()
+        writer = UnicodeWriter(output, encoding='latin-1')
+        for row in rows:
+            writer.writerow(row)
+        self.assertEqual(output.getvalue(), 'S\xe3o Paulo,1,,2.5\r\nplain,x\r\n')
+
+
+class TypedCSVReaderTest(TestCase):
+    """
+    Test csv_utils.TypedCSVReader
+    """
+
+    def test_read(self):
+        import cStringIO
+        from iris_lib.csv_utils import (TypedCSVReader, int_converter, date_converter,
+                                        decimal_converter, country_converter)
+        data = u'name,extra,count,when,country,amount\n"S\xe3o, Paulo",x,3,2015-01-02,Brazil,1.5\nB,,,,usa,\n'
+        reader = TypedCSVReader(cStringIO.StringIO(data.encode('utf-8')), [
+            'name',
+            ('count', int_converter),
+            ('when', date_converter()),
+            ('country', country_converter()),
+            ('amount', decimal_converter),
+        ])
+        self.assertEqual(list(reader.batches(batch_size=1)), [
+            [(u'S\xe3o, Paulo', 3, datetime.date(2015, 1, 2), 'BR', Decimal('1.5'))],
+            [(u'B', None, None, 'US', None)],
+        ])
+        reader = TypedCSVReader(cStringIO.StringIO('a\nx\n'), [('a', int_converter)])
+        self.assertRaises(ValueError, list, reader)
+
+
+class RawJsJSONEncoderTest(TestCase):
+    """
+    Test encoding raw Javascript through RawJsJSONEncoder
+    """
+
+    def test_encode(self):
+        import json
+        from iris_lib.raw_js_json import RawJsJSONEncoder, RawJavaScriptText
+        fn1 = RawJavaScriptText('function(a) { return a; }')
+        fn2 = RawJavaScriptText('function() {}')
+        data = {'a': fn1, 'b': [1, fn2, {'c': fn1}], 'd': 'text'}
+        expected = ('{"a": function(a) { return a; }, "b": [1, function() {}, '
+                    '{"c": function(a) { return a; }}], "d": "text"}')
+        self.assertEqual(json.dumps(data, cls=RawJsJSONEncoder, sort_keys=True), expected)
+        self.assertEqual(''.join(RawJsJSONEncoder(sort_keys=True).iterencode(data)), expected)
+        self.assertEqual(json.dumps(fn2, cls=RawJsJSONEncoder), 'function() {}')
+        self.assertEqual(
+            json.dumps([fn2], cls=RawJsJSONEncoder, indent=1),
+            ''.join(RawJsJSONEncoder(indent=1).iterencode([fn2])))
+
+
+class Select2WidgetTest(TestCase):
+    """
+    Test rendering the Select2 options inline or as a data attribute
+    """
+
+    def test_data_attribute(self):
+        import json
+        import re
+        from HTMLParser import HTMLParser
+        from iris_lib.select2widget import Select2
+        widget = Select2({'placeholder': 'Pick one'}, choices=[(1, 'One')],
+                         use_inline_script=False)
+        html = widget.render('f', 1, attrs={'id': 'id_f'})
+        self.assertNotIn('<script', html)
+        options = re.search(r'data-select2-options="([^"]*)"', html).group(1)
+        options = json.loads(HTMLParser().unescape(options))
+        self.assertEqual((options['placeholder'], options['width']), ('Pick one', 'auto'))
+        # The default is an inline script
+        html = Select2(choices=[(1, 'One')]).render('f', 1, attrs={'id': 'id_f'})
+        self.assertIn('<script', html)
+        self.assertNotIn('data-select2-options', html)
+
+    def test_raw_javascript(self):
+        from iris_lib.raw_js_json import RawJavaScriptText
+        from iris_lib.select2widget import Select2
+        widget = Select2({'formatResult': RawJavaScriptText('function(o) { return o.text; }')},
+                         choices=[(1, 'One')], use_inline_script=False)
+        html = widget.render('f', 1, attrs={'id': 'id_f'})
+        # This can't go in an attribute, so it still uses the script
+        self.assertNotIn('data-select2-options', html)
+        self.assertIn('"formatResult": function(o) { return o.text; }', html)
+
+    def test_cached_options(self):
+        from iris_lib.select2widget import Select2, get_select2_options, _select2_options_cache
+        first = Select2({'placeholder': 'Cached', 'data': [{'id': 1, 'text': 'One'}]})
+        second = Select2({'data': [{'id': 1, 'text': 'One'}], 'placeholder': 'Cached'})
+        other = Select2({'placeholder': 'Other'})
+        size = len(_select2_options_cache)
+        options = get_select2_options(first.select2attrs)
+        self.assertIs(get_select2_options(second.select2attrs), options)
+        self.assertEqual(len(_select2_options_cache), size + 1)
+        self.assertNotEqual(get_select2_options(other.select2attrs), options)
+        self.assertEqual(len(_select2_options_cache), size + 2)
+        # Equal values of different types are kept apart
+        self.assertEqual([get_select2_options({'allowClear': v})[0] for v in (True, 1, 1.0, True)],
+                         ['{"allowClear": true}', '{"allowClear": 1}', '{"allowClear": 1.0}',
+                          '{"allowClear": true}'])
+
+    def test_cache_size(self):
+        from iris_lib import select2widget
+        from iris_lib.select2widget import get_select2_options, _select2_options_cache
+        original_size = select2widget.SELECT2_OPTIONS_CACHE_SIZE
+        select2widget.SELECT2_OPTIONS_CACHE_SIZE = 5
+        try:
+            for i in range(20):
+                get_select2_options({'remoteUrl': '/lookup/%d/' % i})
+                self.assertLessEqual(len(_select2_options_cache), 5)
+        finally:
+            select2widget.SELECT2_OPTIONS_CACHE_SIZE = original_size
+
+
+class CacheWarmerTest(TestCase):
+    """
+    Test the cache warmer, with a request that doesn't go to the service
+    """
+
+    def setUp(self):
+        from django.core.cache import caches
+        from iris_lib.ws_client.events import EventRequest
+        self.cache = caches['default']
+        self.cache.clear()
+
+        class StubRequest(EventRequest):
+            calls = []
+            fail = False
+
+            def get(self):
+                if self.fail:
+                    raise IOError("Service unavailable")
+                self.calls.append(1)
+                return iter([len(self.calls)])
+
+        self.request_class = StubRequest
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def test_get_results(self):
+        from iris_lib.ws_client.cache_warmer import CacheWarmer
+        warmer = CacheWarmer()
+        warmer.register('stub', self.request_class(minmag=6), interval=1000, jitter=0.1)
+        warmed = warmer.requests['stub']
+        timeouts = []
+        original_set = self.cache.set
+
+        def set(key, value, timeout=None):
+            timeouts.append(timeout)
+            return original_set(key, value, timeout)
+        self.cache.set = set
+        try:
+            # A miss runs the request, and caches the results for the warmer's timeout
+            self.assertEqual(warmer.get_results('stub'), [1])
+            self.assertEqual(timeouts, [warmed.get_cache_timeout()])
+            self.assertEqual(warmed.get_cache_timeout(), 2100)
+            # A hit doesn't
+            self.assertEqual(warmer.get_results('stub'), [1])
+            self.assertEqual(len(self.request_class.calls), 1)
+        finally:
+            del self.cache.set
+
+    def test_run_pending(self):
+        from iris_lib.ws_client.cache_warmer import CacheWarmer
+        warmer = CacheWarmer()
+        warmer.register('stub', self.request_class(minmag=6), interval=100, jitter=0.1)
+        warmed = warmer.requests['stub']
+        self.assertEqual(warmer.run_pending(now=1000), 1)
+        self.assertTrue(1090 <= warmed.next_run <= 1110)
+        self.assertEqual(warmer.seconds_until_next(now=1000), warmed.next_run - 1000)
+        # Not due yet
+        self.assertEqual(warmer.run_pending(now=1080), 0)
+        self.assertEqual(warmer.run_pending(now=1110), 1)
+        self.assertEqual(warmer.get_results('stub'), [2])
+        # The refreshes are spread over the jitter range
+        next_runs = set()
+        for i in range(20):
+            warmed.schedule(0)
+            self.assertTrue(90 <= warmed.next_run <= 110)
+            next_runs.add(warmed.next_run)
+        self.assertGreater(len(next_runs), 1)
+
+    def test_failure(self):
+        from iris_lib.ws_client.cache_warmer import CacheWarmer
+        warmer = CacheWarmer()
+        warmer.register('stub', self.request_class(minmag=6), interval=100, jitter=0)
+        warmer.run_pending(now=1000)
+        self.request_class.fail = True
+        # A failed refresh is rescheduled as normal, and the old results are kept
+        self.assertEqual(warmer.run_pending(now=1100), 0)
+        self.assertEqual(warmer.requests['stub'].next_run, 1200)
+        self.assertEqual(warmer.get_results('stub'), [1])
+
+
+class ModelSelect2LookupViewTest(TestCase):
+    """
+    Test the Select2 remote data source view
+    """
+
+    def test_lookup(self):
+        import json
+        from django.contrib.auth.models import Permission
+        from django.test.client import RequestFactory
+        from iris_lib.views import ModelSelect2LookupView
+        view = ModelSelect2LookupView.as_view(
+            queryset=Permission.objects.all(), search_fields=['codename'], page_size=2)
+        data = json.loads(view(RequestFactory().get('/', {'q': 'add_'})).content)
+        self.assertEqual(len(data['results']), 2)
+        self.assertTrue(data['more'])
+        count = Permission.objects.filter(codename__startswith='add_').count()
+        page = (count + 1) // 2
+        data = json.loads(view(RequestFactory().get('/', {'q': 'add_', 'page': page})).content)
+        self.assertFalse(data['more'])
+        data = json.loads(view(RequestFactory().get('/', {'q': 'nothing'})).content)
+        self.assertEqual(data, {'results': [], 'more': False})
+
+
+class AdminURLTest(TestCase):
+    """
+    Test the cached admin URL builder
+    """
+
+    def test_matches_reverse(self):
+        from django.contrib.auth.models import User
+        from django.core.urlresolvers import reverse
+        from iris_lib.admin import get_admin_url, get_add_url
+        for pk in (1, 'a b/c', u'\xe9x_1', 'x?y#z'):
+            self.assertEqual(get_admin_url(User, 'change', pk), reverse('admin:auth_user_change', args=(pk,)))
+            self.assertEqual(get_admin_url(User, 'delete', pk), reverse('admin:auth_user_delete', args=(pk,)))
+        self.assertEqual(get_add_url(User), reverse('admin:auth_user_add'))
+
+    def test_languages(self):
+        from django.conf.urls import include, url
+        from django.conf.urls.i18n import i18n_patterns
+        from django.contrib import admin
+        from django.contrib.auth.models import User
+        from django.test.utils import override_settings
+        from django.utils import translation
+        from iris_lib.admin import get_admin_url
+
+        class urls(object):
+            urlpatterns = i18n_patterns(url(r'^admin/', include(admin.site.urls)))
+
+        with override_settings(ROOT_URLCONF=urls):
+            for language in ('en', 'fr', 'en'):
+                with translation.override(language):
+                    self.assertEqual(get_admin_url(User, 'change', 1),
+                                     '/%s/admin/auth/user/1/' % language)
+
+
+class CountryChoicesTest(TestCase):
+    """
+    Test the per-language country choices
+    """
+
+    def test_choices(self):
+        from django.utils import translation
+        from iris_lib.country import CountryField, get_country_choices, get_country_name
+        choices = get_country_choices()
+        self.assertIs(choices, get_country_choices())
+        self.assertEqual(choices[0][0], 'US')
+        self.assertEqual(get_country_name('GB'), 'United Kingdom')
+        self.assertEqual(get_country_name('ZZ'), 'ZZ')
+        field = CountryField(include_orgs=True)
+        self.assertEqual(len(list(field.choices)), len(get_country_choices(include_orgs=True)))
+        self.assertEqual(len(get_country_choices()), len(choices))
+        name, path, args, kwargs = field.deconstruct()
+        self.assertEqual(kwargs, {'include_orgs': True})
+        with translation.override('fr'):
+            self.assertIsNot(get_country_choices(), choices)
+            form_field = field.formfield()
+            self.assertEqual(list(form_field.choices)[0][0], '')
+
+
+class CountryIndexTest(TestCase):
+    """
+    Test the country search index
+    """
+
+    def test_search(self):
+        from iris_lib.country import get_country_index
+        index = get_country_index()
+        self.assertIs(index, get_country_index())
+        self.assertEqual(index.search('us')[0][0], 'US')
+        self.assertEqual(index.search('USA')[0][0], 'US')
+        self.assertEqual(index.search('840')[0][0], 'US')
+        self.assertEqual(index.search('36')[0][0], 'AU')
+        self.assertIn('AX', [code for code, name in index.search('aland')])
+        self.assertIn('US', [code for code, name in index.search('states')])
+        self.assertEqual(index.search('xyzzy'), [])
+        codes = [code for code, name in index.search('new')]
+        self.assertEqual(len(codes), len(set(codes)))
+        self.assertEqual(len(index.search('')), len(index.choices))
+
+    def test_widget(self):
+        import json
+        import re
+        from HTMLParser import HTMLParser
+        from iris_lib.select2widget import CountrySelect2Remote
+        html = CountrySelect2Remote('/countries/').render('country', 'PE', attrs={'id': 'id_country'})
+        initial = re.search(r'data-select2-initial="([^"]*)"', html).group(1)
+        self.assertEqual(json.loads(HTMLParser().unescape(initial)), [{'id': 'PE', 'text': 'Peru'}])
+
+
+class CountryTest(TestCase):
+    """
+    Test the compact country values
+    """
+
+    def test_country(self):
+        import pickle
+        from iris_lib.country import Country, CountryField
+        us = Country('US')
+        self.assertIs(us, Country(u'US'))
+        self.assertEqual(us, 'US')
+        self.assertEqual(us.name, 'United States')
+        self.assertEqual(us.flag_class, 'flag16 us')
+        self.assertIs(pickle.loads(pickle.dumps(us, 2)), us)
+        field = CountryField(compact=True)
+        self.assertIs(field.from_db_value('US', None, None, None), us)
+        self.assertIs(type(field.get_prep_value(us)), unicode)
+        self.assertEqual(field.deconstruct()[3], {'compact': True})
+        self.assertIs(type(CountryField().from_db_value(u'US', None, None, None)), unicode)
+
+
+class ChoicesTest(TestCase):
+    """
+    Test the Choices lookups and inheritance
+    """
+
+    def test_choices(self):
+        from iris_lib.field_choices import Choices, Choice
+
+        class Status(Choices):
+            OPEN = Choice("Open")
+            CLOSED = Choice("Closed", value='closed')
+
+        class ExtendedStatus(Status):
+            PENDING_REVIEW = Choice()
+            OPEN = Choice("Reopened")
+
+        self.assertIs(Status.get_choices(), Status.get_choices())
+        self.assertEqual(Status.get_localized_choices(), (('OPEN', u'Open'), ('closed', u'Closed')))
+        self.assertEqual(Status.get_value('Closed'), 'closed')
+        self.assertIsNone(Status.get_value('Nope'))
+        self.assertTrue(Status.is_valid('closed'))
+        self.assertFalse(Status.is_valid('CLOSED'))
+        self.assertEqual(Status.get_index('closed'), 1)
+        self.assertEqual(ExtendedStatus.get_values(), ('OPEN', 'closed', 'PENDING_REVIEW'))
+        self.assertEqual(ExtendedStatus.get_label('OPEN'), 'Reopened')
+        self.assertEqual(ExtendedStatus.get_label('PENDING_REVIEW'), 'Pending Review')
+        self.assertEqual(ExtendedStatus.CLOSED, 'closed')
+        self.assertEqual(Status.get_label('OPEN'), 'Open')
+
+
+class ChoicesLabelExpressionTest(TestCase):
+    """
+    Test annotating a queryset with choice labels
+    """
+
+    def test_annotate(self):
+        from django.contrib.auth.models import Permission
+        from iris_lib.field_choices import Choices, Choice
+
+        class Codenames(Choices):
+            ADD_USER = Choice("Add", value='add_user')
+            DELETE_USER = Choice("Delete", value='delete_user')
+
+        queryset = Codenames.annotate_labels(
+            Permission.objects.filter(codename__endswith='_user'), 'codename', default='Other')
+        rows = dict(queryset.values_list('codename', 'codename_label'))
+        self.assertEqual(rows['add_user'], 'Add')
+        self.assertEqual(rows['delete_user'], 'Delete')
+        self.assertEqual(rows['change_user'], 'Other')
+        labels = list(queryset.filter(codename_label='Add').values_list('codename', flat=True))
+        self.assertEqual(labels, ['add_user'])
+
+
+class CompactChoicesFieldTest(TestCase):
+    """
+    Test storing choices as integer codes
+    """
+
+    def test_field(self):
+        from django.core.exceptions import ValidationError
+        from iris_lib.field_choices import Choices, Choice, CompactChoicesField
+
+        class Status(Choices):
+            OPEN = Choice("Open", code=1)
+            PENDING_REVIEW = Choice(code=5)
+
+        field = CompactChoicesField(Status)
+        self.assertEqual(field.get_prep_value(Status.PENDING_REVIEW), 5)
+        self.assertEqual(field.get_prep_value(1), 1)
+        self.assertIsNone(field.get_prep_value(None))
+        self.assertRaises(ValueError, field.get_prep_value, 'CLOSED')
+        self.assertEqual(field.from_db_value(5, None, None, None), 'PENDING_REVIEW')
+        self.assertEqual(field.to_python('1'), 'OPEN')
+        self.assertEqual(field.to_python('OPEN'), 'OPEN')
+        self.assertRaises(ValidationError, field.to_python, '7')
+        # Migrations get the codes, not the class
+        field = CompactChoicesField(Status, default=Status.PENDING_REVIEW)
+        kwargs = field.deconstruct()[3]
+        self.assertEqual(kwargs, {'choices': [(1, 'Open'), (5, 'Pending Review')], 'default': 5})
+        historical = CompactChoicesField(**kwargs)
+        self.assertEqual(historical.get_prep_value(5), 5)
+        self.assertEqual(historical.from_db_value(5, None, None, None), 5)
+        self.assertEqual(historical.get_default(), 5)
+
+        class Unstorable(Choices):
+            OPEN = Choice("Open")
+        self.assertRaises(ValueError, CompactChoicesField, Unstorable)
+
+        def duplicate():
+            class Duplicate(Choices):
+                A = Choice(code=1)
+                B = Choice(code=1)
+        self.assertRaises(ValueError, duplicate)
+
+
+class LightUserModelChoiceFieldTest(TestCase):
+    """
+    Test the values_list-based user choices and lookup
+    """
+
+    def test_choices(self):
+        import json
+        from django.contrib.auth.models import AnonymousUser, Permission, User
+        from django.core.exceptions import PermissionDenied
+        from django.test.client import RequestFactory
+        from iris_lib.fields import LightUserModelChoiceField, UserModelChoiceField
+        from iris_lib.select2widget import Select2Remote
+        from iris_lib.views import UserLookupView
+        User.objects.create(username='a', first_name='Ann', last_name='Ames', email='ann@example.com')
+        User.objects.create(username='b', email='bob@example.com', is_staff=True)
+        User.objects.create(username='c', first_name='Anna', email='anna@example.com',
+                            is_active=False)
+        queryset = User.objects.order_by('pk')
+        field = LightUserModelChoiceField(queryset)
+        self.assertEqual(list(field.choices)[1:], list(UserModelChoiceField(queryset).choices)[1:])
+        self.assertEqual(list(field.choices)[1][1], 'Ann Ames <ann@example.com>')
+        remote = LightUserModelChoiceField(queryset, remote_url='/users/')
+        self.assertIsInstance(remote.widget, Select2Remote)
+        # The second positional argument is still empty_label
+        self.assertEqual(list(LightUserModelChoiceField(queryset, None).choices)[0][1],
+                         'Ann Ames <ann@example.com>')
+
+        view = UserLookupView.as_view()
+        request = RequestFactory().get('/', {'q': 'ann'})
+        request.user = User.objects.get(username='b')
+        data = json.loads(view(request).content)
+        self.assertEqual([r['text'] for r in data['results']], ['Ann Ames <ann@example.com>'])
+        # Only staff, or users with the given permission, can search
+        request.user = User.objects.get(username='a')
+        self.assertRaises(PermissionDenied, view, request)
+        perm_view = UserLookupView.as_view(permission_required='auth.change_user')
+        self.assertRaises(PermissionDenied, perm_view, request)
+        request.user.user_permissions.add(Permission.objects.get(codename='change_user'))
+        request.user = User.objects.get(username='a')
+        self.assertEqual(len(json.loads(perm_view(request).content)['results']), 1)
+        request.user = AnonymousUser()
+        self.assertRaises(PermissionDenied, view, request)
+
+    def test_limited_remote(self):
+        import json
+        from django.contrib.auth.models import User
+        from django.core.exceptions import ValidationError
+        from django.test.client import RequestFactory
+        from iris_lib.fields import LightUserModelChoiceField
+        from iris_lib.views import UserLookupView
+        admin = User.objects.create(username='admin', first_name='Ann', is_staff=True)
+        user = User.objects.create(username='user', first_name='Andy')
+        staff = User.objects.filter(is_staff=True)
+        field = LightUserModelChoiceField(staff, remote_url='/lookup/staff/')
+        request = RequestFactory().get('/', {'q': 'an'})
+        request.user = admin
+
+        def lookup(view):
+            return [r['id'] for r in json.loads(view(request).content)['results']]
+
+        # A general lookup offers users that the field doesn't accept
+        self.assertEqual(lookup(UserLookupView.as_view()), [admin.pk, user.pk])
+        self.assertRaises(ValidationError, field.clean, user.pk)
+        # So the field needs a lookup limited to its queryset
+        self.assertEqual(lookup(UserLookupView.as_view(queryset=staff)), [admin.pk])
+        self.assertEqual(field.clean(admin.pk), admin)
+
+
+class SpamScorerTest(TestCase):
+    """
+    Test the background spam scoring pieces
+    """
+
+    def test_scorer(self):
+        from iris_lib.spam import BloomFilter, SpamScorer, StubSpamService, TTLCache
+        bloom = BloomFilter(capacity=100, items=['192.0.2.%d' % i for i in range(100)])
+        self.assertTrue(all('192.0.2.%d' % i in bloom for i in range(100)))
+        self.assertLess(sum('198.51.100.%d' % i in bloom for i in range(256)), 5)
+
+        cache = TTLCache(timeout=-1)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+        cache = TTLCache(timeout=60, max_entries=2)
+        for key in 'abc':
+            cache.set(key, key)
+        self.assertEqual((len(cache), cache.get('a'), cache.get('c')), (2, None, 'c'))
+
+        service = StubSpamService({'198.51.100.1': 80, 'x@example.com': 95})
+        scorer = SpamScorer(service, blocklist=['192.0.2.1', 'spam.example.com'])
+        self.assertEqual(scorer.score('192.0.2.1', 'x@example.org'), 100)
+        self.assertEqual(scorer.score('198.51.100.2', 'y@SPAM.example.com'), 100)
+        self.assertEqual(scorer.score('198.51.100.1', 'x@example.com'), 95)
+        self.assertEqual(scorer.score('198.51.100.1', 'y@example.com'), 80)
+        self.assertEqual(service.lookups, 3)
+
+    def test_executor(self):
+        import threading
+        from iris_lib.background import BackgroundExecutor
+        results = []
+        executor = BackgroundExecutor(workers=2, queue_size=10)
+        for i in range(5):
+            self.assertTrue(executor.submit(results.append, i))
+        executor.submit(lambda: 1 / 0)
+        executor.join()
+        self.assertEqual(sorted(results), range(5))
+        # A full queue drops work
+        started, blocker = threading.Event(), threading.Event()
+        executor = BackgroundExecutor(workers=1, queue_size=1)
+        executor.submit(lambda: started.set() or blocker.wait())
+        started.wait(5)
+        self.assertTrue(executor.submit(results.append, 'queued'))
+        self.assertFalse(executor.submit(results.append, 'dropped'))
+        blocker.set()
+        executor.join()
+        self.assertIn('queued', results)
+        self.assertNotIn('dropped', results)
+        executor = BackgroundExecutor(synchronous=True)
+        executor.submit(results.append, 'now')
+        self.assertEqual(results[-1], 'now')
+
+
+class ThrottleTest(TestCase):
+    """
+    Test the rate limiters and ThrottleMixin
+    """
+
+    def setUp(self):
+        from django.core.cache import caches
+        from iris_lib import throttle
+        caches['default'].clear()
+        throttle._limiters.clear()
+
+    def tearDown(self):
+        self.setUp()
+
+    def test_limiters(self):
+        import mock
+        from iris_lib import throttle
+        from iris_lib.throttle import MemoryRateLimiter, CacheRateLimiter, parse_rate
+        self.assertEqual(parse_rate('5/m'), (5, 60))
+        self.assertEqual(parse_rate('100/hour'), (100, 3600))
+        self.assertRaises(ValueError, parse_rate, '5')
+        now = [6000.0]
+        with mock.patch.object(throttle.time, 'time', lambda: now[0]):
+            for limiter in (MemoryRateLimiter('3/m', max_entries=2), CacheRateLimiter('3/m')):
+                self.assertEqual([limiter.allow('a') for i in range(4)], [True, True, True, False])
+                self.assertTrue(limiter.allow('b'))
+            memory = MemoryRateLimiter('3/m', max_entries=2)
+            for key in 'abc':
+                memory.allow(key)
+            self.assertEqual(len(memory), 2)
+            memory = MemoryRateLimiter((1, 0.01))
+            memory.allow('a')
+            now[0] += 0.02
+            memory.allow('b')
+            self.assertEqual(len(memory), 1)
+
+            # Retrying while over the limit doesn't keep the client locked out
+            cache_limiter = CacheRateLimiter('3/m', prefix='retry')
+            self.assertEqual([cache_limiter.allow('a') for i in range(13)], [True] * 3 + [False] * 10)
+            # Half way into the next window, half of the previous one still counts
+            now[0] += 90
+            self.assertEqual([cache_limiter.allow('a') for i in range(3)], [True, False, False])
+
+    def test_mixin(self):
+        from django.http.response import HttpResponse
+        from django.test.client import RequestFactory
+        from django.views.generic.base import View
+        from iris_lib.form_mixins import ThrottleMixin
+
+        class ThrottledView(ThrottleMixin, View):
+            throttle_rate = '2/m'
+
+            def get(self, request):
+                return HttpResponse('ok')
+            post = get
+
+        view = ThrottledView.as_view()
+        factory = RequestFactory()
+        statuses = [view(factory.post('/', REMOTE_ADDR='192.0.2.9')).status_code for i in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(view(factory.get('/', REMOTE_ADDR='192.0.2.9')).status_code, 200)
+        self.assertEqual(view(factory.post('/', REMOTE_ADDR='192.0.2.10')).status_code, 200)
+        # Made-up X-Forwarded-For addresses don't get around the limit
+        statuses = [view(factory.post('/', REMOTE_ADDR='192.0.2.11',
+                                      HTTP_X_FORWARDED_FOR='198.51.100.%d' % i)).status_code
+                    for i in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+        # Another view has its own limit, unless it has the same scope
+        class OtherView(ThrottledView):
+            pass
+        self.assertEqual(OtherView.as_view()(factory.post('/', REMOTE_ADDR='192.0.2.9')).status_code,
+                         200)
+        shared = ThrottledView.as_view(throttle_scope='ThrottledView')
+        self.assertEqual(shared(factory.post('/', REMOTE_ADDR='192.0.2.9')).status_code, 429)
+
+    def test_ip_address(self):
+        from django.test.client import RequestFactory
+        from iris_lib.form_mixins import get_request_ip_address
+        request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.2',
+                                        HTTP_X_FORWARDED_FOR='198.51.100.1, 192.0.2.1, 10.0.0.1')
+        self.assertEqual(get_request_ip_address(request), '10.0.0.2')
+        self.assertEqual(get_request_ip_address(request, trusted_proxies=1), '10.0.0.1')
+        self.assertEqual(get_request_ip_address(request, trusted_proxies=2), '192.0.2.1')
+        self.assertEqual(get_request_ip_address(request, trusted_proxies=5), '198.51.100.1')
+        request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(get_request_ip_address(request, trusted_proxies=1), '10.0.0.2')
+
+
+class DeferredAfterSaveTest(TestCase):
+    """
+    Test running FormSaveMixin post-save work in the background
+    """
+
+    def test_defer(self):
+        from django import forms
+        from django.contrib.auth.models import Group
+        from django.test.client import RequestFactory
+        from django.views.generic.edit import FormView
+        from iris_lib.background import synchronous
+        from iris_lib.form_mixins import FormSaveMixin
+        done = []
+
+        class GroupForm(forms.ModelForm):
+            class Meta:
+                model = Group
+                fields = ['name']
+
+        class GroupView(FormSaveMixin, FormView):
+            form_class = GroupForm
+            success_url = '/done/'
+
+            def after_save(self):
+                self.defer_after_save(done.append, self.object.pk)
+
+        view = GroupView.as_view()
+        with synchronous():
+            response = view(RequestFactory().post('/', {'name': 'first'}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(done, [Group.objects.get(name='first').pk])
+
+
+class BackgroundExecutorTest(TransactionTestCase):
+    """
+    Test running tasks in a worker thread once the transaction commits.  This isn't a TestCase,
+    since that keeps a transaction open, so on Django 1.9+ the tasks would never be queued.
+    """
+
+    def test_on_commit(self):
+        import threading
+        from django.db import transaction
+        from iris_lib.background import BackgroundExecutor
+        done = []
+
+        def record(name):
+            done.append((name, threading.current_thread().name))
+
+        executor = BackgroundExecutor(workers=1)
+        executor.submit_on_commit(record, 'first')
+        executor.join()
+        self.assertEqual(done, [('first', 'background-0')])
+        with transaction.atomic():
+            executor.submit_on_commit(record, 'second')
+            done_in_transaction = list(done)
+        executor.join()
+        if hasattr(transaction, 'on_commit'):
+            # Django 1.9+ waits for the commit
+            self.assertEqual(len(done_in_transaction), 1)
+            self.assertEqual(done[-1], ('second', 'background-0'))
+        else:
+            # Otherwise it runs here, so the task can see the uncommitted data
+            self.assertEqual(done_in_transaction[-1], ('second', threading.current_thread().name))
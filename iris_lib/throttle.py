@@ -0,0 +1,150 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+import threading
+import time
+
+###
+# Rate limiting by key (eg. IP address), see form_mixins.ThrottleMixin.
+#
+# Rates are given as "<count>/<unit>" where the unit is s, m, h or d, eg. "20/m".
+#
+# MemoryRateLimiter is a token bucket per key, held in the process.  It's very cheap, but each
+# process keeps its own count.  CacheRateLimiter keeps a sliding window count in a Django cache,
+# so (with a shared cache like memcached) the limit applies across processes.
+#
+# Settings:
+#
+# THROTTLE_RATE = '20/m'
+# THROTTLE_CACHE = 'default'  # Use CacheRateLimiter with this cache, rather than MemoryRateLimiter
+###
+
+THROTTLE_RATE = getattr(settings, 'THROTTLE_RATE', '20/m')
+THROTTLE_CACHE = getattr(settings, 'THROTTLE_CACHE', None)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    Parse a rate like "20/m" into (count, seconds)
+    """
+    if isinstance(rate, (tuple, list)):
+        return int(rate[0]), rate[1]
+    try:
+        count, unit = rate.split('/')
+        return int(count), PERIODS[unit.strip()[0].lower()]
+    except (ValueError, KeyError, IndexError):
+        raise ValueError("Invalid rate %s" % (rate,))
+
+
+class MemoryRateLimiter(object):
+    """
+    In-memory token bucket per key.  Each key can make up to `count` requests at once, and gets
+    them back at a steady rate over `period` seconds.
+
+    Keys are kept in least-recently-used order.  Once a key has been idle long enough for its
+    bucket to refill, its entry is dropped (it would be the same as a new one), and there are
+    never more than `max_entries`, so memory use is bounded.
+    """
+
+    def __init__(self, rate=THROTTLE_RATE, max_entries=10000):
+        self.count, self.period = parse_rate(rate)
+        self.fill_rate = float(self.count) / self.period
+        self.max_entries = max_entries
+        # key -> [tokens, last update time]
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        buckets = self._buckets
+        while buckets:
+            tokens, last = next(buckets.itervalues())
+            if len(buckets) > self.max_entries or last + self.period <= now:
+                buckets.popitem(last=False)
+            else:
+                break
+
+    def allow(self, key):
+        """
+        Take a token for the key; returns False if there are none left
+        """
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                bucket = [self.count, now]
+            else:
+                bucket[0] = min(self.count, bucket[0] + (now - bucket[1]) * self.fill_rate)
+                bucket[1] = now
+            allowed = bucket[0] >= 1
+            if allowed:
+                bucket[0] -= 1
+            self._buckets[key] = bucket
+            self._evict(now)
+        return allowed
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class CacheRateLimiter(object):
+    """
+    Sliding window count per key, stored in a Django cache.  This counts allowed requests in
+    fixed windows of `period` seconds, and estimates the count over the last `period` seconds by
+    weighting the previous window by how much of it overlaps.  Each key uses two cache entries,
+    which expire on their own.
+
+    Rejected requests aren't counted, so a client that keeps retrying is let through again once
+    its earlier requests age out.  (Concurrent requests may both be let through at the limit.)
+    """
+
+    def __init__(self, rate=THROTTLE_RATE, cache_alias='default', prefix='throttle'):
+        self.count, self.period = parse_rate(rate)
+        self.cache_alias = cache_alias
+        self.prefix = prefix
+
+    def get_cache_key(self, key, window):
+        return '%s:%s:%d:%s' % (self.prefix, self.period, window, key)
+
+    def allow(self, key):
+        cache = caches[self.cache_alias]
+        now = time.time()
+        window = int(now // self.period)
+        current_key = self.get_cache_key(key, window)
+        previous_key = self.get_cache_key(key, window - 1)
+        counts = cache.get_many([previous_key, current_key])
+        overlap = 1 - (now - window * self.period) / self.period
+        if counts.get(previous_key, 0) * overlap + counts.get(current_key, 0) + 1 > self.count:
+            return False
+        # add() only sets the key if it's missing, so concurrent requests don't reset it
+        cache.add(current_key, 0, self.period * 2)
+        try:
+            cache.incr(current_key)
+        except ValueError:
+            # Expired in between
+            cache.set(current_key, 1, self.period * 2)
+        return True
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(rate=THROTTLE_RATE, cache_alias=THROTTLE_CACHE):
+    """
+    Return the shared rate limiter for the given rate, using the cache if `cache_alias` is set.
+    Callers sharing a limiter should prefix their keys (eg. with a scope) to count separately.
+    """
+    key = (rate, cache_alias)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                if cache_alias:
+                    limiter = CacheRateLimiter(rate, cache_alias)
+                else:
+                    limiter = MemoryRateLimiter(rate)
+                _limiters[key] = limiter
+    return limiter
@@ -0,0 +1,151 @@
+from django.http.response import JsonResponse
+from django.utils.encoding import force_text
+from django.views.generic.base import View
+from django.db.models import Q
+from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
+from iris_lib.country import get_country_index
+from iris_lib.fields import USER_LABEL_FIELDS, format_user_label
+import operator
+
+# Lookup types that may be given explicitly in search_fields (eg. 'name__iexact')
+QUERY_TERMS = set([
+    'exact', 'iexact', 'contains', 'icontains', 'startswith', 'istartswith',
+    'endswith', 'iendswith', 'search', 'regex', 'iregex',
+])
+
+
+class Select2LookupView(View):
+    """
+    Base view for a Select2 remote data source.  This takes the search term (`q`) and page number
+    (`page`, starting at 1) and responds with JSON in the form Select2 expects:
+
+    {"results": [{"id": 1, "text": "First"}, ...], "more": true}
+
+    Subclasses should implement get_results().
+    """
+    page_size = 20
+
+    def get_results(self, term, offset, limit):
+        """
+        Return a list of (id, text) tuples for the given search term, starting at `offset`.  This
+        should return up to `limit` results, returning all `limit` only if there are more.
+        """
+        raise NotImplementedError()
+
+    def get(self, request, *args, **kwargs):
+        term = request.GET.get('q', '').strip()
+        try:
+            page = max(1, int(request.GET.get('page', 1)))
+        except ValueError:
+            page = 1
+        offset = (page - 1) * self.page_size
+        # Ask for one extra, to find out if there are more pages
+        results = list(self.get_results(term, offset, self.page_size + 1))
+        return JsonResponse({
+            'results': [{'id': id_, 'text': text} for id_, text in results[:self.page_size]],
+            'more': len(results) > self.page_size,
+        })
+
+
+class ModelSelect2LookupView(Select2LookupView):
+    """
+    Select2 remote data source for a queryset.  The search term is matched against each of the
+    `search_fields` using `search_lookup`; the default (istartswith) can use an index on most
+    databases, unlike a "contains" search.
+    """
+    queryset = None
+    search_fields = None
+    search_lookup = 'istartswith'
+
+    def get_queryset(self):
+        queryset = self.queryset.all()
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        return queryset
+
+    def get_search_fields(self):
+        return self.search_fields or ['pk']
+
+    def filter_queryset(self, queryset, term):
+        if not term:
+            return queryset
+        queries = []
+        for field in self.get_search_fields():
+            if field == 'pk':
+                # Only match the key exactly, and only if the term could be one
+                if term.isdigit():
+                    queries.append(Q(pk=term))
+            elif '__' in field and field.rsplit('__', 1)[1] in QUERY_TERMS:
+                queries.append(Q(**{field: term}))
+            else:
+                queries.append(Q(**{'%s__%s' % (field, self.search_lookup): term}))
+        if not queries:
+            return queryset.none()
+        return queryset.filter(reduce(operator.or_, queries))
+
+    def label_from_instance(self, obj):
+        return force_text(obj)
+
+    def get_results(self, term, offset, limit):
+        queryset = self.filter_queryset(self.get_queryset(), term)
+        return [
+            (obj.pk, self.label_from_instance(obj))
+            for obj in queryset[offset:offset + limit]
+        ]
+
+
+class UserLookupView(ModelSelect2LookupView):
+    """
+    Select2 remote data source for users, eg. for fields.LightUserModelChoiceField.  This reads
+    only the label columns, and labels the users the same way as the field does.
+
+    Only staff can search, unless `permission_required` is set, in which case anyone with that
+    permission can.  Inactive users aren't listed, unless `active_only` is False.
+    """
+    search_fields = ['first_name', 'last_name', 'email', 'username']
+    label_fields = USER_LABEL_FIELDS
+    permission_required = None
+    active_only = True
+
+    def has_permission(self, user):
+        if not user.is_authenticated():
+            return False
+        if self.permission_required:
+            return user.has_perm(self.permission_required)
+        return user.is_staff
+
+    def dispatch(self, request, *args, **kwargs):
+        # Don't give out names and addresses to just anyone
+        if not self.has_permission(request.user):
+            raise PermissionDenied
+        return super(UserLookupView, self).dispatch(request, *args, **kwargs)
+
+    def get_queryset(self):
+        if self.queryset is None:
+            self.queryset = get_user_model()._default_manager.all()
+        queryset = super(UserLookupView, self).get_queryset()
+        if self.active_only:
+            queryset = queryset.filter(is_active=True)
+        return queryset
+
+    def label_from_values(self, *values):
+        return format_user_label(*values)
+
+    def get_results(self, term, offset, limit):
+        queryset = self.filter_queryset(self.get_queryset(), term)
+        rows = queryset.values_list('pk', *self.label_fields)[offset:offset + limit]
+        return [(row[0], self.label_from_values(*row[1:])) for row in rows]
+
+
+class CountryLookupView(Select2LookupView):
+    """
+    Select2 remote data source for countries (see select2widget.CountrySelect2Remote), matching
+    country codes and names in the active language.
+    """
+    include_orgs = False
+    include_multiple = False
+
+    def get_results(self, term, offset, limit):
+        index = get_country_index(self.include_orgs, self.include_multiple)
+        return index.search(term)[offset:offset + limit]
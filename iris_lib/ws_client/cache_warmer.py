@@ -0,0 +1,156 @@
+from django.utils.log import getLogger
+import random
+import threading
+import time
+
+LOGGER = getLogger(__name__)
+
+###
+# Keeps the results of frequently-used web service requests in the cache, so that page
+# requests practically never have to wait on the upstream service.
+#
+# Register requests by name (typically in an app's models.py or AppConfig.ready()).  Queries
+# relative to the current time can be registered as a function returning the request:
+#
+# from iris_lib.ws_client.cache_warmer import cache_warmer
+#
+# cache_warmer.register('recent_events', lambda: EventRequest(
+#     starttime=datetime.datetime.utcnow() - datetime.timedelta(days=1)), interval=120)
+# cache_warmer.register('significant_events', EventRequest(minmag=6, limit=20), interval=900)
+#
+# Then in the view:
+#
+# events = cache_warmer.get_results('recent_events')
+#
+# Run the refreshes with `manage.py warm_ws_cache`, or call cache_warmer.start() to run them in
+# a background thread of the current process.
+###
+
+
+class WarmedRequest(object):
+    """
+    A request registered with the CacheWarmer
+    """
+
+    def __init__(self, name, request, interval, jitter):
+        self.name = name
+        self.request = request
+        self.interval = interval
+        self.jitter = jitter
+        # Refresh as soon as the warmer runs
+        self.next_run = 0
+
+    def get_request(self):
+        if callable(self.request):
+            return self.request()
+        return self.request
+
+    def get_cache_key(self):
+        return 'ws_client:warm:%s' % self.name
+
+    def get_cache_timeout(self):
+        # Keep results well past the next refresh, so a slow or failed refresh doesn't leave a gap
+        return int(self.interval * (2 + self.jitter))
+
+    def schedule(self, now):
+        """
+        Schedule the next refresh, jittered so that refreshes don't all line up
+        """
+        self.next_run = now + self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def refresh(self):
+        """
+        Run the request and store the results
+        """
+        return self.get_request().refresh_cache(
+            timeout=self.get_cache_timeout(), cache_key=self.get_cache_key())
+
+
+class CacheWarmer(object):
+    """
+    Periodically re-runs a set of registered requests, storing the results in the cache
+    """
+
+    def __init__(self):
+        self.requests = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, name, request, interval=300, jitter=0.1):
+        """
+        Register a request to keep warm.
+        @param name: a unique name for looking up the results
+        @param request: a BaseRequest, or a callable returning one
+        @param interval: seconds between refreshes
+        @param jitter: fraction of the interval that refreshes are randomly moved by
+        """
+        self.requests[name] = WarmedRequest(name, request, interval, jitter)
+
+    def unregister(self, name):
+        self.requests.pop(name, None)
+
+    def get_results(self, name):
+        """
+        Return the cached results of a registered request, running it if necessary
+        """
+        warmed = self.requests[name]
+        return warmed.get_request().get_cached(
+            timeout=warmed.get_cache_timeout(), cache_key=warmed.get_cache_key())
+
+    def run_pending(self, now=None):
+        """
+        Refresh every request that is due.  Returns the number of requests refreshed.
+        """
+        if now is None:
+            now = time.time()
+        refreshed = 0
+        for warmed in self.requests.values():
+            if warmed.next_run > now:
+                continue
+            try:
+                results = warmed.refresh()
+                LOGGER.debug("Refreshed %s: %d results", warmed.name, len(results))
+                refreshed += 1
+            except Exception as e:
+                LOGGER.error("Failed to refresh %s: %s", warmed.name, e, exc_info=1)
+            warmed.schedule(now)
+        return refreshed
+
+    def seconds_until_next(self, now=None):
+        """
+        Return the number of seconds until the next refresh is due
+        """
+        if not self.requests:
+            return None
+        if now is None:
+            now = time.time()
+        return max(0, min(r.next_run for r in self.requests.values()) - now)
+
+    def run_forever(self, max_sleep=60):
+        """
+        Refresh requests as they come due, until stop() is called
+        """
+        while not self._stop.is_set():
+            self.run_pending()
+            delay = self.seconds_until_next()
+            if delay is None or delay > max_sleep:
+                delay = max_sleep
+            self._stop.wait(delay)
+
+    def start(self):
+        """
+        Run the refreshes in a background (daemon) thread
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='ws-cache-warmer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+# The default warmer
+cache_warmer = CacheWarmer()
@@ -21,6 +21,16 @@ def parse_decimal(value):
     if value is not None:
         return Decimal(value)
 
+def json_value(value):
+    """
+    Convert a parsed value to a type that can be serialized as JSON
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
 class Event(object):
     def __init__(self, obj_data):
         self.event_id = parse_int(obj_data.get('EventID'))
@@ -43,6 +53,13 @@ class Event(object):
             ((k,str(v)) for k,v in self.__dict__.iteritems())
         ))
     
+    def json_dict(self):
+        """
+        Return the event as a dict of JSON-ready values; numbers are numeric and the time
+        is in ISO format.
+        """
+        return dict((k, json_value(v)) for k, v in self.__dict__.iteritems())
+    
     def latitude_str(self):
         """ Stringify latitude """
         if self.latitude >= 0:
@@ -77,6 +94,8 @@ class EventRequest(ws_request.BaseRequest):
         maxlat = ws_request.WSParam(),
         minlon = ws_request.WSParam(),
         maxlon = ws_request.WSParam(),
+        minmag = ws_request.WSParam(),
+        maxmag = ws_request.WSParam(),
         limit = ws_request.WSParam(default=50),
         nodata = ws_request.WSParam(),
         format = ws_request.WSParam(default='text'),
@@ -0,0 +1,131 @@
+from django.http.response import StreamingHttpResponse
+import json
+
+###
+# Streaming export of events as JSON
+#
+# Each of the iter_* functions takes a stream of events (eg. from EventRequest.get()) and
+# yields the output in chunks, so the export never needs to be held in memory.
+#
+# Example:
+#
+# def events_view(request):
+#     return events_response(EventRequest(starttime=...).get(), format='geojson')
+#
+# with open('events.ndjson', 'w') as f:
+#     write_events(EventRequest(starttime=...).get(), f, format='ndjson')
+###
+
+# Number of events serialized per chunk
+CHUNK_SIZE = 100
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def _iter_chunks(items, chunk_size, head, separator, tail):
+    """
+    Yield `head`, then the (already encoded) items separated by `separator`, then `tail`,
+    grouping `chunk_size` items into each chunk.
+    """
+    chunk = [head]
+    first = True
+    for item in items:
+        if first:
+            first = False
+        else:
+            chunk.append(separator)
+        chunk.append(item)
+        if len(chunk) >= chunk_size * 2:
+            yield ''.join(chunk)
+            chunk = []
+    chunk.append(tail)
+    yield ''.join(chunk)
+
+
+def iter_json(events, chunk_size=CHUNK_SIZE):
+    """
+    Yield a JSON array of events
+    """
+    encode = _encoder.encode
+    return _iter_chunks(
+        (encode(event.json_dict()) for event in events),
+        chunk_size, '[', ',', ']\n')
+
+
+def iter_ndjson(events, chunk_size=CHUNK_SIZE):
+    """
+    Yield newline-delimited JSON, one event per line
+    """
+    encode = _encoder.encode
+    return _iter_chunks(
+        (encode(event.json_dict()) for event in events),
+        chunk_size, '', '\n', '\n')
+
+
+def geojson_feature(event):
+    """
+    Return a GeoJSON Feature for an event
+    """
+    properties = event.json_dict()
+    longitude = properties.pop('longitude')
+    latitude = properties.pop('latitude')
+    feature = {
+        'type': 'Feature',
+        'id': event.event_id,
+        'properties': properties,
+        'geometry': None,
+    }
+    if longitude is not None and latitude is not None:
+        feature['geometry'] = {
+            'type': 'Point',
+            'coordinates': [longitude, latitude],
+        }
+    return feature
+
+
+def iter_geojson(events, chunk_size=CHUNK_SIZE):
+    """
+    Yield a GeoJSON FeatureCollection of events
+    """
+    encode = _encoder.encode
+    return _iter_chunks(
+        (encode(geojson_feature(event)) for event in events),
+        chunk_size, '{"type":"FeatureCollection","features":[', ',', ']}\n')
+
+
+# Format name -> (generator, content type)
+FORMATS = {
+    'json': (iter_json, 'application/json'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+    'geojson': (iter_geojson, 'application/vnd.geo+json'),
+}
+
+
+def iter_events(events, format='json', chunk_size=CHUNK_SIZE):
+    """
+    Yield the events in the given format
+    """
+    if format not in FORMATS:
+        raise ValueError("Unknown format %s" % (format,))
+    return FORMATS[format][0](events, chunk_size=chunk_size)
+
+
+def write_events(events, f, format='json', chunk_size=CHUNK_SIZE):
+    """
+    Write the events to the file-like object `f` in the given format
+    """
+    for chunk in iter_events(events, format=format, chunk_size=chunk_size):
+        f.write(chunk)
+
+
+def events_response(events, format='json', filename=None, chunk_size=CHUNK_SIZE):
+    """
+    Return a StreamingHttpResponse of the events in the given format.  If `filename`
+    is given, the response is sent as an attachment.
+    """
+    response = StreamingHttpResponse(
+        iter_events(events, format=format, chunk_size=chunk_size),
+        content_type='%s; charset=utf-8' % FORMATS[format][1])
+    if filename:
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
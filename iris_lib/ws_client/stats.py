@@ -0,0 +1,170 @@
+from collections import Counter
+from decimal import Decimal
+from itertools import izip, repeat
+import datetime
+import math
+
+###
+# Aggregate statistics over a stream of events
+#
+# Example:
+#
+# stats = EventStats(mag_bin=0.5, time_bin='day', grid_size=5)
+# stats.update(EventRequest(starttime=..., endtime=...).get())
+# stats.magnitudes   # {Decimal('4.5'): 120, Decimal('5.0'): 31, ...}
+# stats.times        # {datetime.date(2015,1,1): 41, ...}
+# stats.grid         # {(-20, -180): 3, ...}  (keyed by the SW corner of each cell)
+#
+# Stats are plain counters, so they can be pickled (eg. into the Django cache) and merged,
+# so an incremental update only needs to process the new events:
+#
+# stats.merge(EventStats.for_params(stats.params).update(new_events))
+###
+
+
+def truncate_hour(t):
+    return t.replace(minute=0, second=0, microsecond=0)
+
+
+def truncate_day(t):
+    return t.date()
+
+
+def truncate_month(t):
+    return datetime.date(t.year, t.month, 1)
+
+
+def truncate_year(t):
+    return datetime.date(t.year, 1, 1)
+
+
+def bin_index(value, size, float_size):
+    """
+    Return the index of the bin containing the value.  Decimals (as parsed from the web service)
+    are binned exactly, anything else is binned as a float.
+    """
+    if isinstance(value, Decimal):
+        return int(math.floor(value / size))
+    return int(math.floor(value / float_size))
+
+
+TIME_BINS = {
+    'hour': truncate_hour,
+    'day': truncate_day,
+    'month': truncate_month,
+    'year': truncate_year,
+}
+
+
+class EventStats(object):
+    """
+    Counts of events by magnitude bin, time bin and lat/lon grid cell, built in one pass.
+    """
+
+    def __init__(self, mag_bin=0.5, time_bin='day', grid_size=1):
+        if time_bin not in TIME_BINS:
+            raise ValueError("Unknown time bin %s" % (time_bin,))
+        self.mag_bin = Decimal(str(mag_bin))
+        self.time_bin = time_bin
+        self.grid_size = Decimal(str(grid_size))
+        self.count = 0
+        self.magnitudes = Counter()
+        self.times = Counter()
+        self.grid = Counter()
+
+    @property
+    def params(self):
+        """
+        The binning parameters; stats can only be merged if these match
+        """
+        return dict(mag_bin=self.mag_bin, time_bin=self.time_bin, grid_size=self.grid_size)
+
+    @classmethod
+    def for_params(cls, params):
+        return cls(**params)
+
+    def update(self, events):
+        """
+        Add a stream of events.  Returns self, so this can be chained.
+        """
+        return self.update_rows(self._rows(events))
+
+    def _rows(self, events):
+        for event in events:
+            yield event.magnitude, event.time, event.latitude, event.longitude
+
+    def update_columns(self, magnitudes=None, times=None, latitudes=None, longitudes=None):
+        """
+        Add a columnar batch of events.  A column that isn't given counts as all None, but at
+        least one must be given.  Returns self.
+        """
+        columns = (magnitudes, times, latitudes, longitudes)
+        if all(column is None for column in columns):
+            raise ValueError("No columns given")
+        return self.update_rows(izip(*[
+            repeat(None) if column is None else column for column in columns
+        ]))
+
+    def update_rows(self, rows):
+        """
+        Add an iterable of (magnitude, time, latitude, longitude) tuples.  Any value may be None.
+        Returns self.
+        """
+        # Pull everything into locals, this is the hot loop
+        mag_bin = self.mag_bin
+        float_mag_bin = float(mag_bin)
+        grid_size = self.grid_size
+        float_grid_size = float(grid_size)
+        truncate_time = TIME_BINS[self.time_bin]
+        magnitude_counts = self.magnitudes
+        time_counts = self.times
+        grid_counts = self.grid
+        count = 0
+        for magnitude, time, latitude, longitude in rows:
+            count += 1
+            if magnitude is not None:
+                magnitude_counts[bin_index(magnitude, mag_bin, float_mag_bin) * mag_bin] += 1
+            if time is not None:
+                time_counts[truncate_time(time)] += 1
+            if latitude is not None and longitude is not None:
+                grid_counts[(
+                    bin_index(latitude, grid_size, float_grid_size) * grid_size,
+                    bin_index(longitude, grid_size, float_grid_size) * grid_size,
+                )] += 1
+        self.count += count
+        return self
+
+    def merge(self, other):
+        """
+        Add the counts from another EventStats with the same parameters.  Returns self.
+        """
+        if other.params != self.params:
+            raise ValueError("Can't merge stats with different parameters: %s, %s" % (
+                self.params, other.params))
+        self.count += other.count
+        self.magnitudes.update(other.magnitudes)
+        self.times.update(other.times)
+        self.grid.update(other.grid)
+        return self
+
+    def __add__(self, other):
+        return self.for_params(self.params).merge(self).merge(other)
+
+    def cumulative_magnitudes(self):
+        """
+        Return a list of (magnitude, count of events at or above that magnitude), in
+        ascending magnitude order.  This is the usual Gutenberg-Richter form.
+        """
+        total = 0
+        result = []
+        for magnitude in sorted(self.magnitudes, reverse=True):
+            total += self.magnitudes[magnitude]
+            result.append((magnitude, total))
+        result.reverse()
+        return result
+
+    def sorted_times(self):
+        """
+        Return a list of (time bin, count) in time order
+        """
+        return sorted(self.times.iteritems())
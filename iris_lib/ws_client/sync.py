@@ -0,0 +1,216 @@
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from django.utils.log import getLogger
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+LOGGER = getLogger(__name__)
+
+###
+# Bulk persistence of web service entities into a Django model
+#
+# Example:
+#
+# class CatalogEvent(models.Model):
+#     event_id = models.IntegerField(unique=True)
+#     time = models.DateTimeField(null=True)
+#     latitude = models.DecimalField(max_digits=8, decimal_places=4, null=True)
+#     longitude = models.DecimalField(max_digits=8, decimal_places=4, null=True)
+#     magnitude = models.DecimalField(max_digits=4, decimal_places=2, null=True)
+#     location = models.CharField(max_length=200, blank=True)
+#
+# req = EventRequest(starttime=datetime.date(2014,1,1), endtime=datetime.date(2015,1,1), limit=100000)
+# sync = EntitySync(CatalogEvent, batch_size=1000)
+# sync.sync(req.get())
+# print "%d created, %d updated" % (sync.created, sync.updated)
+#
+# Only the model fields that share a name with an entity attribute are copied.
+###
+
+# Attributes of an events.Event, in the order they're parsed
+EVENT_FIELDS = (
+    'event_id', 'time', 'latitude', 'longitude', 'depth',
+    'author', 'catalog', 'contributor', 'contributor_id',
+    'mag_type', 'magnitude', 'mag_author', 'location',
+)
+
+
+def normalize_value(field, value):
+    """
+    Return a value as it would come back from the database, for comparing with a stored value
+    """
+    if value is None:
+        return value
+    value = field.to_python(value)
+    if isinstance(value, Decimal) and getattr(field, 'decimal_places', None) is not None:
+        try:
+            value = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+        except InvalidOperation:
+            pass
+    elif settings.USE_TZ and hasattr(value, 'tzinfo') and timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return value
+
+
+class EntitySync(object):
+    """
+    Writes a stream of entities (eg. events.Event) to a model, in batches.  Each batch is
+    written inside a transaction, using one query to fetch the rows that already exist,
+    one bulk_create for the new rows and one update for the existing rows that have changed.
+    Existing rows that haven't changed aren't written.
+
+    `skipped` counts the entities that weren't written: those without a key, and existing
+    ones that were unchanged (or all existing ones, if update_existing is False).
+    """
+
+    def __init__(self, model, key='event_id', fields=None, batch_size=500,
+                 update_existing=True, progress=None):
+        """
+        @param model: the model class to write to
+        @param key: the field (and entity attribute) that uniquely identifies an entity
+        @param fields: the fields to copy; defaults to the concrete model fields matching EVENT_FIELDS
+        @param batch_size: the number of entities written per transaction
+        @param update_existing: if False, entities already in the table are skipped
+        @param progress: optional callable, called with this object after each batch
+        """
+        self.model = model
+        self.key = key
+        if fields is None:
+            field_names = set(f.name for f in model._meta.concrete_fields)
+            fields = [f for f in EVENT_FIELDS if f in field_names]
+        self.fields = [f for f in fields if f != key]
+        self.batch_size = batch_size
+        self.update_existing = update_existing
+        self.progress = progress
+        self.reset()
+
+    def reset(self):
+        """
+        Reset the progress counters
+        """
+        self.processed = 0
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.batches = 0
+
+    def get_values(self, entity):
+        """
+        Return a dict of field values for the given entity
+        """
+        return dict((f, getattr(entity, f, None)) for f in self.fields)
+
+    def get_changes(self, values, stored):
+        """
+        Return a dict of the values that differ from the stored row
+        """
+        changes = {}
+        for name, stored_value in zip(self.fields, stored):
+            value = values[name]
+            field = self.model._meta.get_field(name)
+            if normalize_value(field, value) != normalize_value(field, stored_value):
+                changes[name] = value
+        return changes
+
+    def update_rows(self, changed):
+        """
+        Update the changed rows, given as {key: {field: value}}.  This sets each field with a
+        CASE expression on the key, so all the rows are updated in one query (or a few, if the
+        database limits the number of query parameters).
+        """
+        connection = connections[router.db_for_write(self.model)]
+        keys = list(changed)
+        # Each row takes up to two parameters per field, plus one for the key
+        params_per_row = ['param'] * (2 * len(self.fields) + 1)
+        chunk_size = max(1, connection.ops.bulk_batch_size(params_per_row, keys))
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            updates = {}
+            for name in self.fields:
+                field = self.model._meta.get_field(name)
+                whens = [
+                    When(**{self.key: key_value,
+                            'then': Value(changed[key_value][name], output_field=field)})
+                    for key_value in chunk if name in changed[key_value]
+                ]
+                if whens:
+                    updates[name] = Case(*whens, default=F(name), output_field=field)
+            self.model._default_manager.filter(
+                **{'%s__in' % self.key: chunk}
+            ).update(**updates)
+
+    def sync(self, entities):
+        """
+        Write all the given entities, returning this object (so the counters can be checked)
+        """
+        entities = iter(entities)
+        while True:
+            batch = list(islice(entities, self.batch_size))
+            if not batch:
+                break
+            self.write_batch(batch)
+            if self.progress:
+                self.progress(self)
+        return self
+
+    def write_batch(self, batch):
+        """
+        Write one batch of entities inside a transaction
+        """
+        # Collapse duplicates within the batch; the last one wins
+        by_key = {}
+        for entity in batch:
+            key_value = getattr(entity, self.key, None)
+            if key_value is None:
+                self.skipped += 1
+            else:
+                by_key[key_value] = entity
+        self.processed += len(batch)
+        self.batches += 1
+        if not by_key:
+            return
+
+        manager = self.model._default_manager
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            existing = {}
+            if self.update_existing:
+                for row in manager.filter(
+                        **{'%s__in' % self.key: by_key.keys()}
+                ).values_list(self.key, *self.fields):
+                    existing[row[0]] = row[1:]
+            else:
+                existing = dict.fromkeys(manager.filter(
+                    **{'%s__in' % self.key: by_key.keys()}
+                ).values_list(self.key, flat=True))
+            new_objects = []
+            changed = {}
+            for key_value, entity in by_key.iteritems():
+                values = self.get_values(entity)
+                if key_value in existing:
+                    if self.update_existing:
+                        changes = self.get_changes(values, existing[key_value])
+                        if changes:
+                            changed[key_value] = changes
+                            continue
+                    self.skipped += 1
+                else:
+                    values[self.key] = key_value
+                    new_objects.append(self.model(**values))
+            if changed:
+                self.update_rows(changed)
+                self.updated += len(changed)
+            if new_objects:
+                manager.bulk_create(new_objects)
+                self.created += len(new_objects)
+        LOGGER.debug("Synced batch %d: %d processed, %d created, %d updated, %d skipped",
+                     self.batches, self.processed, self.created, self.updated, self.skipped)
+
+
+def sync_events(model, events, **kwargs):
+    """
+    Shortcut to write a stream of events to a model.  Returns the EntitySync, which has
+    the progress counters.
+    """
+    return EntitySync(model, **kwargs).sync(events)
@@ -1,4 +1,8 @@
 import requests
+import hashlib
+import urllib
+from django.core.cache import caches
+from iris_lib.ws_client import ws_settings
 
 ###
 # Webservice request library
@@ -77,6 +81,8 @@ class BaseRequest(object):
     # The subclass must define this.  It is a dict of parameter names to WSParam types.
     param_types = None
     url = None
+    # Number of seconds that get_cached() results are kept
+    cache_timeout = ws_settings.WS_CACHE_TIMEOUT
     
     def __init__(self, **params):
         if not self.param_types:
@@ -141,6 +147,36 @@ class BaseRequest(object):
         r.raise_for_status()
         return self.parse(r)
 
+    def get_cache(self):
+        return caches[ws_settings.WS_CACHE_ALIAS]
+
+    def get_cache_key(self):
+        """
+        Return a cache key identifying this query
+        """
+        query = '%s?%s' % (self.get_url(), urllib.urlencode(sorted(self.get_params().items())))
+        return 'ws_client:%s' % hashlib.md5(query).hexdigest()
+
+    def get_cached(self, timeout=None, cache_key=None):
+        """
+        Like get(), but returns a list of values from the cache if available.  If they aren't
+        cached, the query is run and the results are cached (for `timeout` seconds, if given).
+        """
+        results = self.get_cache().get(cache_key or self.get_cache_key())
+        if results is None:
+            results = self.refresh_cache(timeout=timeout, cache_key=cache_key)
+        return results
+
+    def refresh_cache(self, timeout=None, cache_key=None):
+        """
+        Run the query and cache the results, returning them as a list.
+        """
+        results = list(self.get())
+        if timeout is None:
+            timeout = self.cache_timeout
+        self.get_cache().set(cache_key or self.get_cache_key(), results, timeout)
+        return results
+
     def parse(self, response):
         """
         Parse the query response.  By default, this parses as FDSN text/csv format.
@@ -1,4 +1,11 @@
+from django.conf import settings
+
 FDSN_WS_BASE_URL = 'http://service.iris.edu'
 
 FDSN_EVENT_WS_VERSION = 1
-FDSN_EVENT_WS_URL = '%s/fdsnws/event/%s/query' % (FDSN_WS_BASE_URL, FDSN_EVENT_WS_VERSION)
\ No newline at end of file
+FDSN_EVENT_WS_URL = '%s/fdsnws/event/%s/query' % (FDSN_WS_BASE_URL, FDSN_EVENT_WS_VERSION)
+
+# Cache used by BaseRequest.get_cached() and the cache warmer
+WS_CACHE_ALIAS = getattr(settings, 'WS_CACHE_ALIAS', 'default')
+# Default number of seconds to cache web service results
+WS_CACHE_TIMEOUT = getattr(settings, 'WS_CACHE_TIMEOUT', 300)